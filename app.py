@@ -1,13 +1,27 @@
+import datetime
 import sys
-from file import read_prog
+import threading
+import time
+from file import read_image, read_prog, read_syms
 import msg_ as m
 
-from uart import Uart, UartPacketIn
+from uart import Uart
+from capture import Capture
+from spool import Spool
+from store import LiveStore
+from metrics import Metrics, MetricsWriter
+from archive import open_stored
+from sampler import Sampler, by_hits, by_loc, by_sym, hot_spots
+from watch import Watch, WatchError
+from regs import reg_names
+from stepper import Stepper
+from verify import Verifier
+from timeline import Timeline
 from data import (
-    Db, Instr, Page
+    Db, DbError, Instr, Page, Session, Sym, sym_lookup
 )
 from term import (
-    Window, abort, dialog, ensure_vga, main_view, menu, pager, picker, popup, progress, task_bar, top_bar, whbk
+    Window, abort, dialog, ensure_vga, flush, main_view, menu, pager, picker, popup, progress, task_bar, timeline, top_bar, whbk
 )
 from view import (
     ModeModel, Overlays, PageModel, UartModel
@@ -18,17 +32,80 @@ class AppExit(Exception):
     pass
 
 
+# held arrow key moves by more pages the longer it is held,
+# (held for seconds, pages per key)
+_accel = ((2.0, 100), (0.5, 10), (0.0, 1))
+# pages per PgUp/PgDn
+_page_step = 100
+
+
+class Board:
+    def __init__(self, name, capture):
+        self.name = name
+        self.capture = capture
+
+        self.uart_model = UartModel(0, 0, capture.dev)
+        self.page_model = PageModel(0, 0, True, True)
+        self.mode_model = ModeModel('empty*', 'ready*')
+        if capture.top > 0:
+            self.page_model = PageModel(1, capture.top, False, True)
+
+        self.prog = capture.db.find_all(Instr)
+        self.syms = capture.db.find_all(Sym)
+        # last profile is kept after sampling stops
+        self.sampler = None
+        # built and read by ui thread only, never by capture worker
+        self.timeline = None
+
+        self._rx_ticks = capture.rx_ticks
+        self._tx_ticks = capture.tx_ticks
+        self._hits = len(capture.hits)
+
+    def sync(self, tick):
+        before = (self.page_model, self.mode_model, self.uart_model)
+
+        capture = self.capture
+        if capture.last and capture.last.ndx != self.page_model.top:
+            self.page_model = self.page_model.upsert_page(capture.last)
+
+        while self._hits < len(capture.hits):
+            _, ndx = capture.hits[self._hits]
+            self._hits += 1
+            self.page_model = self.page_model.jump_to(ndx)
+            self.mode_model = self.mode_model.to_halt()
+
+        # indicators and mode animation run at a fixed pace
+        if tick:
+            if capture.rx_ticks != self._rx_ticks:
+                self.uart_model = self.uart_model.flash_rx()
+            else:
+                self.uart_model = self.uart_model.reset_rx()
+            if capture.tx_ticks != self._tx_ticks:
+                self.uart_model = self.uart_model.flash_tx()
+            else:
+                self.uart_model = self.uart_model.reset_tx()
+            self._rx_ticks = capture.rx_ticks
+            self._tx_ticks = capture.tx_ticks
+
+            self.mode_model = self.mode_model.update(self.page_model)
+
+        return before != (self.page_model, self.mode_model, self.uart_model)
+
+
 class App:
-    def __init__(self, scr, filename, is_tty):
+    def __init__(
+        self, scr, filenames, is_tty, shares=None, spools=None,
+        attach=False, metrics=None, verify=False, fps=30, anim_ms=100
+    ):
+        self.frame_ms = 1000 // fps
+        self.anim_ms = anim_ms
+
         self.win = Window(scr)
-        self.win.with_timeout(100)
+        self.win.with_timeout(self.frame_ms)
 
         self.views = Overlays()
 
-        self.device = filename if is_tty else None
-        self.stored = filename if not is_tty else None
-
-        if not filename:
+        if not filenames:
             abort(
                 self.win,
                 m.no_file_dev_,
@@ -36,29 +113,154 @@ class App:
                 lambda: RuntimeError('no filename')
             )
 
-        self.uart_model = UartModel(0, 0, self.device)
-        self.page_model = PageModel(0, 0, True, True)
-        self.mode_model = ModeModel('empty*', 'ready*')
-
-        if self.device:
-            self.uart = Uart.open(self.device)
-        else:
-            self.uart = Uart.null()
-        if self.stored:
-            self.db = Db.to_file(self.stored)
+        self.boards = []
+        for filename in filenames:
+            try:
+                capture = self._open(
+                    filename, is_tty, shares or {}, spools or {}, attach
+                )
+            except DbError as e:
+                abort(
+                    self.win,
+                    m.fatal_error_,
+                    f'{filename}: {e}',
+                    lambda: e
+                )
+            self.boards.append(Board(filename, capture))
+        self.board = self.boards[0]
+
+        self._metrics = None
+        if metrics:
+            captures = [board.capture for board in self.boards]
+            self._metrics = MetricsWriter(Metrics(captures), metrics)
+            self._metrics.start()
+
+        # call stack pane is shown in place of datamem
+        self.show_stack = False
+        # direction, held since, last key of arrow key being held
+        self._held = (0, 0.0, 0.0)
+
+        self._saver = None
+        self._save_error = None
+        # device memory is read back after upload, needs firmware support
+        self.verify = verify
+        self._verifier = None
+
+    def _open(self, filename, is_tty, shares, spools, attach):
+        if attach:
+            # another rivctl owns the device and shares pages in the file
+            db = Db.attach(filename)
+            capture = Capture(filename, Uart.null(), db, follow=True)
+        elif is_tty:
+            share = shares.get(filename)
+            # live pages are kept in a bounded ring, older ones on disk
+            db = Db.shared(share) if share else LiveStore()
+            uart = Uart.open(filename)
+            if filename in spools:
+                uart.spool = Spool(spools[filename])
+            capture = Capture(filename, uart, db)
         else:
-            self.db = Db.in_memory()
+            return Capture(None, Uart.null(), open_stored(filename))
+        # every device is served by its own ingest worker
+        capture.start()
+        return capture
+
+    @property
+    def uart(self):
+        return self.board.capture.uart
+
+    @property
+    def db(self):
+        return self.board.capture.db
+
+    @property
+    def prog(self):
+        return self.board.prog
+
+    @prog.setter
+    def prog(self, prog):
+        self.board.prog = prog
+
+    @property
+    def page_model(self):
+        return self.board.page_model
+
+    @page_model.setter
+    def page_model(self, page_model):
+        self.board.page_model = page_model
+
+    @property
+    def mode_model(self):
+        return self.board.mode_model
+
+    @mode_model.setter
+    def mode_model(self, mode_model):
+        self.board.mode_model = mode_model
+
+    @property
+    def uart_model(self):
+        return self.board.uart_model
 
     def _redraw_static(self):
         task_bar(self.win, self.uart_model)
-        top_bar(self.win, self.mode_model, self.page_model, ['File', 'Page'])
-        self.win.refresh()
+        acts = ['File', 'Page'] + (['Dev'] if len(self.boards) > 1 else [])
+        top_bar(self.win, self.mode_model, self.page_model, acts)
 
 
     def _save_to_db(self, path):
         filename = f'{path}.db' if not path.endswith('.db') else path
-        self.db.save_db(filename)
-        return 'quit'
+        if self._saver and self._saver.is_alive():
+            self.views.show(popup(
+                m.save_as_,
+                m.save_busy_text_,
+                [('ok', None)]
+            ))
+            return 'ok'
+
+        _on_save, = self.views.show(progress(m.saving_, 20))
+        db = self.db
+
+        def _save():
+            snap = None
+            try:
+                # snapshot is taken here too, off the ui thread
+                snap = db.snapshot()
+                snap.save_db(filename, _on_save)
+            except DbError as e:
+                self._save_error = e
+            finally:
+                if snap:
+                    snap.close()
+
+        # capture keeps running while the copy is made in background
+        self._saver = threading.Thread(target=_save)
+        self._saver.start()
+        return 'ok'
+
+    def _check_save(self):
+        if self._save_error:
+            self._save_error = None
+            self.views.show(popup(
+                m.save_error_,
+                m.save_error_text_,
+                [('ok', None)]
+            ))
+
+    def _check_verify(self):
+        verifier = self._verifier
+        if not verifier or not verifier.finished:
+            return
+        self._verifier = None
+        if verifier.lost:
+            # firmware without checksums, not asked again this run
+            self.verify = False
+            text = m.verify_lost_text_
+        elif verifier.bad:
+            blocks = ', '.join(str(i) for i in verifier.bad[:8])
+            text = f'{m.verify_bad_text_}\n{blocks}'
+        else:
+            text = m.verify_ok_text_
+        self.views.show(popup(m.verify_, text, [('ok', None)]))
 
     def _go_to_page(self, page):
         if page:
@@ -74,6 +276,66 @@ class App:
         
         return 'quit'
 
+    def _go_to_time(self, text):
+        try:
+            clock = datetime.time.fromisoformat(text.strip())
+        except ValueError:
+            clock = None
+        sessions = self.db.find_all(Session)
+        ndx = None
+        if clock and sessions:
+            # clock time is taken on the day capture started
+            first = min(session.wall for session in sessions)
+            started = datetime.datetime.fromtimestamp(first / 1e9)
+            when = datetime.datetime.combine(started.date(), clock)
+            if when < started.replace(second=0, microsecond=0):
+                when += datetime.timedelta(days=1)
+            ndx = self.db.ndx_at_wall(int(when.timestamp() * 1e9))
+        if ndx is None:
+            self.views.show(popup(
+                m.jump_time_,
+                m.bad_time_text_,
+                [('ok', None)]
+            ))
+            return 'ok'
+
+        self.page_model = self.page_model.jump_to(ndx)
+        return 'quit'
+
+    def _show_jump_time(self):
+        self.views.show(dialog(
+            m.jump_time_,
+            m.jump_time_text_,
+            [(m.cancel_, None), ('go', self._go_to_time)]
+        ))
+
+    def _show_link_stats(self):
+        def _ms(ns):
+            return f'{ns / 1e6:10.3f} ms'
+
+        gaps = self.db.gaps()
+        lines = [
+            f'packets   {gaps.count + 1 if gaps.count else 0:10}',
+            f'mean gap  {_ms(gaps.mean)}',
+            f'min gap   {_ms(gaps.min)}',
+            f'max gap   {_ms(gaps.max)}',
+            f'stalls    {gaps.stalls:10}',
+            '',
+        ]
+        for ndx, gap in self.db.stalls():
+            at = self.db.time_of(ndx)
+            clock = datetime.datetime.fromtimestamp(at / 1e9) if at else None
+            lines.append(
+                f'{ndx:10}  {_ms(gap)}  '
+                f'{clock.strftime("%H:%M:%S.%f")[:-3] if clock else ""}'
+            )
+        self.views.show(pager(
+            m.link_stats_,
+            '\n'.join(lines + ['.']),
+            (53, 12),
+            [('ok', None)]
+        ))
+
     def _show_quit(self):
         def _quit(_):
             raise AppExit('quit')
@@ -106,6 +368,126 @@ class App:
             [(m.cancel_, None), ('go', self._go_to_page)]
         ))
 
+    def _add_watch(self, text):
+        capture = self.board.capture
+        if not text.strip():
+            capture.watches = []
+            return 'quit'
+
+        try:
+            watch = Watch(text)
+        except WatchError as e:
+            self.views.show(popup(
+                m.watch_,
+                f'{m.bad_watch_text_}\n{e}',
+                [('ok', None)]
+            ))
+            return 'ok'
+
+        capture.watches = capture.watches + [watch]
+        return 'quit'
+
+    def _show_watch(self):
+        active = [watch.text for watch in self.board.capture.watches]
+        self.views.show(dialog(
+            m.watch_,
+            '\n'.join([m.watch_text_] + active),
+            [(m.cancel_, None), ('add', self._add_watch)]
+        ))
+
+    def _step_n(self, text):
+        try:
+            n = int(text)
+            if n <= 0:
+                raise ValueError('non-positive step count')
+        except ValueError:
+            self.views.show(popup(
+                m.step_n_,
+                m.bad_steps_text_,
+                [('ok', None)]
+            ))
+            return 'ok'
+
+        _on_step, = self.views.show(progress(m.stepping_, 20))
+        self.mode_model = self.mode_model.to_1step()
+        self.board.capture.stepper = Stepper(n, on_step=_on_step)
+        return 'ok'
+
+    def _show_step_n(self):
+        self.views.show(dialog(
+            m.step_n_,
+            m.step_n_text_,
+            [(m.cancel_, None), ('step', self._step_n)]
+        ))
+
+    def _to_hit(self, loc):
+        pc = int(loc, 16)
+        ndx = self.db.next_at(pc, self.page_model.now)
+        if ndx is None:
+            # wrap around to the first hit
+            ndx = self.db.next_at(pc)
+        if ndx is not None:
+            self.page_model = self.page_model.jump_to(ndx)
+        return 'quit'
+
+    def _find(self, text):
+        try:
+            matches = self.db.search_prog(text)
+        except DbError:
+            matches = []
+        if not matches:
+            self.views.show(popup(
+                m.find_,
+                m.not_found_text_,
+                [('ok', None)]
+            ))
+            return 'ok'
+
+        acts = []
+        for match in matches:
+            hits = self.db.count_at(int(match.loc, 16))
+            acts.append((
+                f'{match.loc:>8}  {match.sym[:12]:<12}  '
+                f'{match.src[:32]:<32} {hits:6}',
+                lambda _, loc=match.loc: self._to_hit(loc)
+            ))
+        self.views.show(menu((2, 2), acts))
+        return 'ok'
+
+    def _show_find(self):
+        self.views.show(dialog(
+            m.find_,
+            m.find_text_,
+            [(m.cancel_, None), ('find', self._find)]
+        ))
+
+    def _timeline(self, series):
+        # series 0 is pc, the rest are registers
+        board = self.board
+        reg = series - 1 if series else None
+        if not board.timeline or board.timeline.reg != reg:
+            board.timeline = Timeline(reg)
+        return board.timeline
+
+    def _to_timeline(self, ndx):
+        self.page_model = self.page_model.jump_to(ndx)
+        return 'quit'
+
+    def _show_timeline(self):
+        self.views.show(timeline(
+            m.timeline_,
+            (72, 12),
+            ['pc'] + reg_names,
+            lambda series: self._timeline(series).count,
+            lambda series, lo, hi, n: self._timeline(series).columns(
+                lo, hi, n, self.db
+            ),
+            self._to_timeline
+        ))
+
+    def _toggle_stack(self):
+        self.show_stack = not self.show_stack
+
     def _to_latest(self):
         self.page_model = self.page_model.to_follow()
 
@@ -116,7 +498,7 @@ class App:
             [('ok', None)]
         ))
     
-    def _show_upload_preview(self, dump):
+    def _show_upload_preview(self, dump, syms):
         instrs = list(dump)
 
         text = '\n'.join(
@@ -127,12 +509,25 @@ class App:
         def _upload(_):
             self.mode_model = self.mode_model.to_upload()
             self.db.drop_all(Instr)
-            for instr in instrs:
-                self.db.save_one(instr)
+            self.db.save_many(instrs)
+            self.db.drop_all(Sym)
+            self.db.save_many(syms)
+            try:
+                self.db.index_prog()
+            except DbError:
+                # search falls back to a plain scan
+                pass
+            self.prog = instrs
+            self.board.syms = syms
 
             _on_send, = self.views.show(progress(m.uploading_, 20))
 
             self.uart.send_prog([instr.code for instr in instrs], _on_send)
+            if self.verify:
+                # device memory is checked block by block after upload
+                verifier = Verifier(instrs)
+                self.board.capture.verify(verifier)
+                self._verifier = verifier
             return 'ok'
         
         self.views.show(pager(
@@ -143,10 +538,56 @@ class App:
             whbk
         ))
 
+    def _toggle_profile(self):
+        capture = self.board.capture
+        if capture.sampler:
+            capture.sampler = None
+            self.mode_model = self.mode_model.to_run()
+            self._show_hot_spots(by_hits)
+        else:
+            self.board.sampler = Sampler()
+            capture.sampler = self.board.sampler
+            self.mode_model = self.mode_model.to_sample()
+            self.uart.send_start()
+
+    def _show_hot_spots(self, order):
+        sampler = self.board.sampler
+        if not sampler:
+            return 'quit'
+
+        spots = order(hot_spots(sampler.hist(), self.prog, self.board.syms))
+        total = max(sampler.total, 1)
+        text = '\n'.join(
+            [
+                f'{spot.hits:>7} {spot.hits * 100 / total:5.1f}%  '
+                f'{spot.loc:08x}  {spot.sym[:16]:<16}  {spot.src}'
+                for spot in spots
+            ] +
+            ['.']
+        )
+
+        self.views.show(pager(
+            m.hot_spots_,
+            text,
+            (73, 15),
+            [
+                ('ok', None),
+                ('func', lambda _: self._show_hot_spots(by_sym)),
+                ('addr', lambda _: self._show_hot_spots(by_loc)),
+                ('hits', lambda _: self._show_hot_spots(by_hits))
+            ],
+            whbk
+        ))
+        return 'ok'
+
     def _show_upload(self):
         def parse_program(path):
             try:
-                self._show_upload_preview(read_prog(path))
+                if path.endswith('.bin'):
+                    self._show_upload_preview(read_image(path), [])
+                    return
+                syms = list(read_syms(path))
+                self._show_upload_preview(read_prog(path), syms)
             except IOError:
                 self._show_upload_bad_file()
 
@@ -157,119 +598,320 @@ class App:
             parse_program
         ))
 
+    def _check_capture(self):
+        for board in self.boards:
+            if board.capture.error:
+                abort(
+                    self.win,
+                    m.fatal_error_,
+                    f'{board.capture.dev}: {board.capture.error}',
+                    lambda: board.capture.error
+                )
+
+    def _to_board(self, board):
+        self.board = board
+        return 'quit'
+
+    def _show_summary(self):
+        lines = []
+        for i, board in enumerate(self.boards):
+            capture = board.capture
+            mark = '>' if board is self.board else ' '
+            lines.append(
+                f'{mark}{i + 1:2}  {board.name:<24} '
+                f'{capture.top:8} pages  {board.mode_model.ctl}'
+            )
+        self.views.show(pager(
+            m.devices_,
+            '\n'.join(lines),
+            (53, 8),
+            [('ok', None)]
+        ))
+
+    def _show_devices(self):
+        acts = [
+            (
+                f'{i + 1} {board.name}',
+                lambda _, board=board: self._to_board(board)
+            )
+            for i, board in enumerate(self.boards)
+        ]
+        self.views.show(menu(
+            (13, 1),
+            acts + [
+                ('-', None),
+                (
+                    f'{m.summary_} ...',
+                    lambda _: self._show_summary()
+                )
+            ]
+        ))
+
+    def _on_key(self, arg):
+        if arg == 'Q':
+            self._show_quit()
+        if arg == 'H':
+            self._show_help()
+        if arg == 'S':
+            self._show_save()
+        if arg == 'U':
+            self._show_upload()
+        if arg == 'N':
+            self._show_jump()
+        if arg == 'W':
+            self._show_watch()
+        if arg == 'L':
+            self._to_latest()
+        if arg == 'T':
+            self._show_timeline()
+        if arg == 'B':
+            self._toggle_stack()
+        if arg == 'D' and len(self.boards) > 1:
+            self._show_devices()
+        if arg.isdigit() and 0 < int(arg) <= len(self.boards):
+            self._to_board(self.boards[int(arg) - 1])
+        if arg == 'F':
+            self.views.show(menu(
+                (1, 1), 
+                [
+                    (
+                        f'{m.save_as_} ...', 
+                        lambda _: self._show_save()
+                    ),
+                    (
+                        f'{m.upload_} ...', 
+                        lambda _: self._show_upload()
+                    ),
+                    (
+                        f'{m.hot_spots_} ...',
+                        lambda _: self._show_hot_spots(by_hits)
+                    ),
+                    ('-', None),
+                    (
+                        f'{m.help_}', 
+                        lambda _: self._show_help()
+                    ),
+                    (
+                        f'{m.quit_}', 
+                        lambda _: self._show_quit()
+                    )
+                ]
+            ))
+        if arg == 'P':
+            self.views.show(menu(
+                (7, 1),
+                [
+                    (
+                        f'{m.to_page_} ...', 
+                        lambda _: self._show_jump()
+                    ),
+                    (
+                        f'{m.jump_time_} ...',
+                        lambda _: self._show_jump_time()
+                    ),
+                    (
+                        f'{m.latest_}', 
+                        lambda _: self._to_latest()
+                    ),
+                    (
+                        f'{m.watch_} ...',
+                        lambda _: self._show_watch()
+                    ),
+                    (
+                        f'{m.find_} ...',
+                        lambda _: self._show_find()
+                    ),
+                    (
+                        f'{m.timeline_} ...',
+                        lambda _: self._show_timeline()
+                    ),
+                    (
+                        f'{m.callstack_}',
+                        lambda _: self._toggle_stack()
+                    ),
+                    (
+                        f'{m.link_stats_} ...',
+                        lambda _: self._show_link_stats()
+                    )
+                ]
+            ))
+        if arg == 'h' or arg == 'p':
+            self.mode_model = self.mode_model.to_halt()
+            self.uart.send_halt()
+            self.uart.send_print()
+        if arg == 'z':
+            self.mode_model = self.mode_model.to_run()
+            self.uart.send_start()
+        if arg == 'a':
+            self.mode_model = self.mode_model.to_cycle()
+            self.uart.send_cycle()
+            self.uart.send_print()
+        if arg == 's':
+            self.mode_model = self.mode_model.to_1step()
+            self.uart.send_step()
+            self.uart.send_print()
+        if arg == 'r':
+            self.mode_model = self.mode_model.to_reset()
+            self.uart.send_reset()
+        if arg == 'f':
+            self._show_find()
+        if arg == 'm':
+            self._show_step_n()
+        if arg == 'x':
+            self._toggle_profile()
+        if arg == 'X':
+            self._show_hot_spots(by_hits)
+
+    def _on_event(self, ev, arg):
+        if self.views.has_any:
+            # closed overlay has to be painted over
+            return self.views.update((ev, arg))
+        elif ev == 'key':
+            assert isinstance(arg, str)
+            self._on_key(arg)
+        elif ev == 'move':
+            assert isinstance(arg, tuple)
+            mx, _ = arg
+            if mx:
+                self.page_model = self.page_model.move_to(mx)
+        elif ev == 'page':
+            self._on_page(arg)
+        return False
+
+    def _accelerate(self, mx, repeat_gap=0.2):
+        now = time.monotonic()
+        direction, since, last = self._held
+        way = 1 if mx > 0 else -1
+        if way != direction or now - last > repeat_gap:
+            since = now
+        self._held = (way, since, now)
+        for held, factor in _accel:
+            if now - since >= held:
+                return mx * factor
+        return mx
+
+    def _on_page(self, arg):
+        if arg == 'up':
+            self.page_model = self.page_model.move_to(-_page_step)
+        if arg == 'down':
+            self.page_model = self.page_model.move_to(_page_step)
+        if arg == 'home':
+            self.page_model = self.page_model.jump_to(1)
+        if arg == 'end':
+            self.page_model = self.page_model.jump_to(self.page_model.top)
+
+    def _coalesce(self, events):
+        # queued left/right keys become a single move, pages in between
+        # are never looked up, every key is accelerated on its own
+        merged = []
+        for ev, arg in events:
+            if ev == 'move' and arg[0]:
+                arg = (self._accelerate(arg[0]), arg[1])
+            if ev == 'move' and arg[1] == 0 and merged:
+                last_ev, last_arg = merged[-1]
+                if last_ev == 'move' and last_arg[1] == 0 and (
+                    (last_arg[0] > 0) == (arg[0] > 0)
+                ):
+                    merged[-1] = ('move', (last_arg[0] + arg[0], 0))
+                    continue
+            merged.append((ev, arg))
+        return merged
+
+    def _poll_all(self, tick):
+        # block for at most a frame, then take whatever else is queued
+        events = []
+        ev, arg = self.win.poll()
+        self.win.with_timeout(0)
+        while ev != 'empty':
+            events.append((ev, arg))
+            ev, arg = self.win.poll()
+        self.win.with_timeout(self.frame_ms)
+
+        # overlays count idle polls, they only get them at animation pace
+        if tick:
+            events.append((ev, arg))
+        return events
+
+    def _stack(self):
+        capture = self.board.capture
+        now = self.page_model.now
+        if capture.callstack.count < now:
+            # stored trace is still being walked
+            return []
+        sym_of = sym_lookup(self.board.syms)
+        frames = capture.callstack.backtrace(now)
+        return [(frame.pc, sym_of(frame.pc)) for frame in frames]
+
+    def _backfill(self):
+        # timeline is fed here, a chunk per tick, so it never changes
+        # while drawn, call stack only when no worker keeps it up
+        board = self.board
+        capture = board.capture
+        shown = []
+        if self.views.has_any and board.timeline:
+            shown.append(board.timeline)
+        if self.show_stack and not capture.running:
+            shown.append(capture.callstack)
+        fed = False
+        for index in shown:
+            count = index.count
+            index.catch_up(capture.db, capture.top)
+            fed = fed or index.count != count
+        return fed
+
+    def _render(self):
+        # screen is composed in memory, only the difference is output
+        page = self.db.find_by_ndx(Page, self.page_model.now)
+        stack = self._stack() if self.show_stack else None
+        main_view(self.win, page, self.prog, 0, stack)
+        self._redraw_static()
+        self.win.stage()
+        self.views.stage()
+        flush()
+
     def loop(self):
         try:
-            top_ndx = self.db.count(Page)
-            if top_ndx > 0:
-                self.page_model = PageModel(1, top_ndx, False, True)
-                page = self.db.find_by_ndx(Page, 1)
-
+            dirty = True
+            drawn_at = 0
+            anim_at = 0
             while True:
                 ensure_vga(self.win)
 
-                page = self.db.find_by_ndx(Page, self.page_model.now)
-
-                value = self.uart.receive()
-                if type(value) is int:
-                    if value > 0:
-                        self.uart_model = self.uart_model.flash_rx()
-                    else:
-                        self.uart_model = self.uart_model.reset_rx()
-                elif type(value) is UartPacketIn:
-                    data = value.data.decode(encoding='ascii')
-                    pc, regs = data.strip('P\n').split(',', 1)
-                    page = Page(self.page_model.top + 1, pc, f'00000000,{regs}')
-                    self.db.save_one(page)
-                    self.page_model = self.page_model.upsert_page(page)
-
-                if self.uart.send():
-                    self.uart_model = self.uart_model.flash_tx()
-                else:
-                    self.uart_model = self.uart_model.reset_tx()
-                
-                self.mode_model = self.mode_model.update(self.page_model)
-
-                ev, arg = self.win.poll()
-                if self.views.has_any:
-                    self.views.update((ev, arg))
-                elif ev == 'key':
-                    assert isinstance(arg, str)
-                    if arg == 'Q':
-                        self._show_quit()
-                    if arg == 'H':
-                        self._show_help()
-                    if arg == 'S':
-                        self._show_save()
-                    if arg == 'U':
-                        self._show_upload()
-                    if arg == 'N':
-                        self._show_jump()
-                    if arg == 'L':
-                        self._to_latest()
-                    if arg == 'F':
-                        self.views.show(menu(
-                            (1, 1), 
-                            [
-                                (
-                                    f'{m.save_as_} ...', 
-                                    lambda _: self._show_save()
-                                ),
-                                (
-                                    f'{m.upload_} ...', 
-                                    lambda _: self._show_upload()
-                                ),
-                                ('-', None),
-                                (
-                                    f'{m.help_}', 
-                                    lambda _: self._show_help()
-                                ),
-                                (
-                                    f'{m.quit_}', 
-                                    lambda _: self._show_quit()
-                                )
-                            ]
-                        ))
-                    if arg == 'P':
-                        self.views.show(menu(
-                            (7, 1),
-                            [
-                                (
-                                    f'{m.to_page_} ...', 
-                                    lambda _: self._show_jump()
-                                ),
-                                (
-                                    f'{m.latest_}', 
-                                    lambda _: self._to_latest()
-                                )
-                            ]
-                        ))
-                    if arg == 'h' or arg == 'p':
-                        self.mode_model = self.mode_model.to_halt()
-                        self.uart.send_halt()
-                        self.uart.send_print()
-                    if arg == 'z':
-                        self.mode_model = self.mode_model.to_run()
-                        self.uart.send_start()
-                    if arg == 'a':
-                        self.mode_model = self.mode_model.to_cycle()
-                        self.uart.send_cycle()
-                        self.uart.send_print()
-                    if arg == 's':
-                        self.mode_model = self.mode_model.to_1step()
-                        self.uart.send_step()
-                        self.uart.send_print()
-                    if arg == 'r':
-                        self.mode_model = self.mode_model.to_reset()
-                        self.uart.send_reset()
-                    main_view(self.win, page, self.db.find_all(Instr), 0)
-                elif ev == 'move':
-                    assert isinstance(arg, tuple)
-                    mx, _ = arg
-                    self.page_model = self.page_model.move_to(mx)
-                    main_view(self.win, page, self.db.find_all(Instr), 0)
-                else:
-                    main_view(self.win, page, self.db.find_all(Instr), 0)
-                self._redraw_static()
+                self._check_capture()
+                self._check_save()
+                self._check_verify()
+
+                now = time.monotonic_ns() // 1000000
+                tick = now - anim_at >= self.anim_ms
+                if tick:
+                    anim_at = now
+                for board in self.boards:
+                    if board.sync(tick) and board is self.board:
+                        dirty = True
+                if tick and self._backfill():
+                    dirty = True
+
+                events = self._poll_all(tick)
+                if not self.views.has_any:
+                    events = self._coalesce(events)
+                for ev, arg in events:
+                    closed = self._on_event(ev, arg)
+                    dirty = dirty or closed or ev != 'empty'
+
+                # ingest runs in capture workers, screen is only redrawn
+                # when something changed and at most once per frame
+                if dirty and now - drawn_at >= self.frame_ms:
+                    self._render()
+                    dirty = False
+                    drawn_at = now
+                elif tick and self.views.has_any:
+                    # overlays may change on their own, eg. progress
+                    self.views.stage()
+                    flush()
         finally:
-            self.uart.close()
-            self.db.close()
+            if self._saver:
+                self._saver.join()
+            if self._metrics:
+                self._metrics.stop()
+            for board in self.boards:
+                board.capture.close()
@@ -0,0 +1,223 @@
+import json
+import lzma
+import struct
+import zlib
+
+from collections import OrderedDict
+
+from data import Db, Gaps, Instr, Page, Sym, scan_prog
+from tracefile import TraceFile, pack_pages, record_size, unpack_pages
+
+
+_magic = b'RVZ1'
+_version = 1
+# magic, version, codec, pages per block, page count, meta offset, index offset
+_header = struct.Struct('<4sHHIQQQ')
+
+_codecs = {
+    'zlib': (0, lambda data: zlib.compress(data, 6), zlib.decompress),
+    'lzma': (1, lzma.compress, lzma.decompress),
+}
+_decoders = {key: decode for key, _, decode in _codecs.values()}
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def open_stored(filename):
+    if filename.endswith('.rvz'):
+        return Archive.open(filename)
+    if filename.endswith('.rvt'):
+        return TraceFile.open(filename)
+    return Db.stored(filename)
+
+
+def write_archive(db, filename, codec='zlib', block_pages=1024):
+    if codec not in _codecs:
+        raise ArchiveError(f'unknown codec \'{codec}\'')
+    key, encode, _ = _codecs[codec]
+
+    top = db.count(Page)
+    with open(filename, 'wb') as fp:
+        fp.write(_header.pack(_magic, _version, key, block_pages, 0, 0, 0))
+
+        offsets = []
+        for lo in range(1, top + 1, block_pages):
+            pages = list(db.iter_range(Page, lo, lo + block_pages))
+            offsets.append(fp.tell())
+            fp.write(encode(pack_pages(pages)))
+        meta_at = fp.tell()
+        offsets.append(meta_at)
+
+        # program is small, kept as a single block
+        meta = {
+            'Instr': db.find_all(Instr),
+            'Sym': db.find_all(Sym),
+        }
+        fp.write(encode(json.dumps(meta).encode(encoding='utf-8')))
+        index_at = fp.tell()
+        fp.write(struct.pack(f'<{len(offsets)}Q', *offsets))
+
+        fp.seek(0)
+        fp.write(_header.pack(
+            _magic, _version, key, block_pages, top, meta_at, index_at
+        ))
+
+
+class Archive:
+    def __init__(self, fp, decode, block_pages, top, offsets, meta, cached):
+        self._fp = fp
+        self._decode = decode
+        self._block_pages = block_pages
+        self._top = top
+        self._offsets = offsets
+        self._meta = meta
+        self._cached = cached
+        self._blocks = OrderedDict()
+
+    @classmethod
+    def open(cls, filename, cached=8):
+        fp = open(filename, 'rb')
+        head = fp.read(_header.size)
+        if len(head) < _header.size:
+            raise ArchiveError('truncated archive header')
+        magic, version, key, block_pages, top, meta_at, index_at = (
+            _header.unpack(head)
+        )
+        if magic != _magic or version != _version or key not in _decoders:
+            raise ArchiveError('not a rivctl archive')
+        decode = _decoders[key]
+
+        fp.seek(index_at)
+        index = fp.read()
+        offsets = struct.unpack(f'<{len(index) // 8}Q', index)
+
+        fp.seek(meta_at)
+        meta = json.loads(decode(fp.read(index_at - meta_at)))
+        return cls(fp, decode, block_pages, top, offsets, meta, cached)
+
+    def _block(self, i):
+        data = self._blocks.get(i)
+        if data is not None:
+            self._blocks.move_to_end(i)
+            return data
+
+        lo, hi = self._offsets[i], self._offsets[i + 1]
+        self._fp.seek(lo)
+        data = self._decode(self._fp.read(hi - lo))
+        self._blocks[i] = data
+        if len(self._blocks) > self._cached:
+            self._blocks.popitem(last=False)
+        return data
+
+    def __len__(self):
+        return self._top
+
+    # read-only Db-like interface
+
+    def count(self, ent_type):
+        if ent_type is Page:
+            return self._top
+        return len(self._meta.get(ent_type.__name__, []))
+
+    def find_by_ndx(self, ent_type, ndx):
+        if ent_type is not Page or ndx < 1 or ndx > self._top:
+            return None
+        i, j = divmod(ndx - 1, self._block_pages)
+        data = self._block(i)
+        off = j * record_size
+        page, = unpack_pages(ndx, data[off:off + record_size])
+        return page
+
+    def find_all(self, ent_type):
+        if ent_type is Page:
+            return list(self.iter_range(Page, 1, self._top + 1))
+        rows = self._meta.get(ent_type.__name__, [])
+        return [ent_type._make(row) for row in rows]
+
+    def iter_range(self, ent_type, lo, hi):
+        if ent_type is not Page:
+            yield from self.find_all(ent_type)[max(lo - 1, 0):hi - 1]
+            return
+        ndx = max(lo, 1)
+        hi = min(hi, self._top + 1)
+        while ndx < hi:
+            i, j = divmod(ndx - 1, self._block_pages)
+            n = min(self._block_pages - j, hi - ndx)
+            data = self._block(i)
+            off = j * record_size
+            yield from unpack_pages(ndx, data[off:off + n * record_size])
+            ndx += n
+
+    def save_one(self, ent):
+        pass
+
+    def save_many(self, ents):
+        pass
+
+    def save_batch(self, *ent_lists):
+        pass
+
+    def drop_all(self, ent_type):
+        pass
+
+    def index_prog(self):
+        pass
+
+    def search_prog(self, text, limit=15):
+        return scan_prog(self.find_all(Instr), self.find_all(Sym), text, limit)
+
+    def next_at(self, pc, after=0):
+        for page in self.iter_range(Page, after + 1, self._top + 1):
+            if int(page.pc, 16) == pc:
+                return page.ndx
+        return None
+
+    def count_at(self, pc):
+        pages = self.iter_range(Page, 1, self._top + 1)
+        return sum(1 for page in pages if int(page.pc, 16) == pc)
+
+    # pages are stored without receive time
+
+    def time_of(self, ndx):
+        return None
+
+    def ndx_at_wall(self, wall):
+        return None
+
+    def gaps(self, lo=1, hi=None, stall=100000000):
+        return Gaps(0, 0, 0, 0, 0)
+
+    def stalls(self, stall=100000000, limit=15):
+        return []
+
+    def snapshot(self):
+        db = Db.in_memory()
+        for lo in range(1, self._top + 1, self._block_pages):
+            db.save_many(self.iter_range(Page, lo, lo + self._block_pages))
+        db.save_many(self.find_all(Instr))
+        db.save_many(self.find_all(Sym))
+        return db
+
+    def close(self):
+        self._blocks.clear()
+        self._fp.close()
+
+
+def pack(src, dst, codec='zlib'):
+    db = open_stored(src)
+    try:
+        write_archive(db, dst, codec)
+    finally:
+        db.close()
+
+
+def unpack(src, dst):
+    archive = Archive.open(src)
+    try:
+        snap = archive.snapshot()
+        snap.save_db(dst)
+        snap.close()
+    finally:
+        archive.close()
@@ -0,0 +1,77 @@
+import bisect
+
+from array import array
+from collections import namedtuple
+
+from data import Page
+
+
+# frames are immutable and share their callers, a stack is just its top
+# frame, pc is where the callee was entered and ret where it returns to
+Frame = namedtuple('Frame', 'pc ret up depth')
+
+
+def _push(top, pc, ret):
+    return Frame(pc, ret, top, top.depth + 1 if top else 1)
+
+
+def frames(top):
+    # innermost frame first
+    while top:
+        yield top
+        top = top.up
+
+
+class CallStack:
+    def __init__(self, max_depth=256):
+        self.max_depth = max_depth
+        self.count = 0
+        # pages where the stack changed and its top from there on
+        self._ndxs = array('q')
+        self._tops = []
+        self._top = None
+        self._pc = None
+
+    def _feed(self, pc, ra):
+        top = self._top
+        prev = self._pc
+        self._pc = pc
+        if prev is None or pc == prev + 4:
+            return top
+
+        if ra == prev + 4 and pc != ra:
+            # ra was just set to the address after a jump, a call
+            if top and top.depth >= self.max_depth:
+                return top
+            return _push(top, pc, ra)
+
+        # returns may skip frames, eg. after longjmp or a tail call
+        for frame in frames(top):
+            if frame.ret == pc:
+                return frame.up
+        return top
+
+    def extend_pages(self, pages):
+        for page in pages:
+            # regs start with x0, ra is x1
+            ra = int(page.regs.split(',', 2)[1], 16)
+            top = self._feed(int(page.pc, 16), ra)
+            if top is not self._top:
+                self._top = top
+                # read by ui thread, top has to be there before its ndx
+                self._tops.append(top)
+                self._ndxs.append(page.ndx)
+            self.count = page.ndx
+
+    def catch_up(self, db, top, limit=20000):
+        hi = min(top + 1, self.count + 1 + limit)
+        if hi > self.count + 1:
+            self.extend_pages(list(db.iter_range(Page, self.count + 1, hi)))
+
+    def at(self, ndx):
+        # top frame at page ndx, None when outside of any call
+        i = bisect.bisect_right(self._ndxs, ndx) - 1
+        return self._tops[i] if i >= 0 else None
+
+    def backtrace(self, ndx):
+        return list(frames(self.at(ndx)))
@@ -0,0 +1,243 @@
+import threading
+import time
+
+from callstack import CallStack
+from chain import chain_pages, ensure_chain, last_link, link_of
+from data import Page, Session, Stamp
+from metrics import Latency
+from packet import Parser
+
+
+class Capture:
+    def __init__(self, dev, uart, db, idle=0.005, follow=False):
+        self.dev = dev
+        self.uart = uart
+        self.db = db
+        self.idle = idle
+        # pages are written by another process, only read here
+        self.follow = follow
+        self._version = None
+        # hash of the last stored page, False when earlier pages have none
+        self._link = None
+
+        self.top = db.count(Page)
+        self.last = db.find_by_ndx(Page, self.top) if self.top else None
+        # bumped on every receive/send, ui flashes indicators on change
+        self.rx_ticks = 0
+        self.tx_ticks = 0
+
+        self.error = None
+        # counts parsed and skipped packets
+        self.parser = Parser()
+        self.store_latency = Latency()
+        # set while profiling, samples replace stored pages
+        self.sampler = None
+        # replaced as a whole by ui, hits are (watch text, page ndx)
+        self.watches = []
+        self.hits = []
+        # set while stepping in batches
+        self.stepper = None
+        # handed over by verify, dropped when device memory was checked
+        self.verifier = None
+        self._verify_next = None
+        # shadow call stack, kept up to date with every stored page
+        self.callstack = CallStack()
+
+        # notified after every busy pump, scripts wait on it for replies
+        self.changed = threading.Condition()
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _ingest(self, packet, ndx):
+        at = packet.at
+        packet = self.parser.parse(packet.data)
+        if packet is None:
+            return None
+        sampler = self.sampler
+        if sampler:
+            sampler.hit(packet.pc, time.monotonic())
+            return None
+        text = packet.text
+        return Page(ndx, text[:8], f'00000000,{text[9:]}'), Stamp(ndx, at)
+
+    def _store(self, pages, stamps):
+        start = time.perf_counter()
+        if self._link is None:
+            # earlier pages of files saved before hashing are hashed
+            # once here, the only place chains are written on capture
+            ensure_chain(self.db)
+            link = last_link(self.db, pages[0].ndx - 1)
+            self._link = False if link is None else link
+        chains = []
+        if self._link is not False:
+            chains = chain_pages(self._link, pages)
+            self._link = link_of(chains[-1])
+        # whole batch goes in as a single transaction
+        self.db.save_batch(pages, stamps, chains)
+        self.store_latency.record(time.perf_counter() - start)
+        self._seen(pages)
+
+    def _seen(self, pages):
+        self.top = pages[-1].ndx
+        self.last = pages[-1]
+
+        now = time.monotonic()
+        stepper = self.stepper
+        watches = self.watches
+        for page in pages:
+            if stepper:
+                stepper.hit(now)
+            if watches:
+                self._check_watches(watches, page)
+        if stepper and stepper.finished:
+            self.stepper = None
+        self.feed_indexes(pages)
+
+    def _check_watches(self, watches, page):
+        pc = int(page.pc, 16)
+        regs = page.regs.split(',')
+        for watch in watches:
+            if watch.check(pc, regs):
+                stepper = self.stepper
+                if stepper:
+                    # no step goes out past the hit
+                    stepper.cancel()
+                # stop the core right away, ui jumps to the page later
+                self.uart.send_halt()
+                self.uart.send_print()
+                self.hits.append((watch.text, page.ndx))
+                break
+
+    def pump(self, max_packets=1024):
+        busy = False
+        pages = []
+        stamps = []
+        # drain everything the port has buffered so far
+        for _ in range(max_packets):
+            value = self.uart.receive()
+            if type(value) is int:
+                busy = busy or value > 0
+                break
+            busy = True
+            if value.data[:1] == b'C':
+                verifier = self.verifier
+                if verifier:
+                    verifier.reply(self.uart, value.data, time.monotonic())
+                continue
+            ingested = self._ingest(value, self.top + len(pages) + 1)
+            if ingested:
+                page, stamp = ingested
+                pages.append(page)
+                stamps.append(stamp)
+        if pages:
+            self._store(pages, stamps)
+        else:
+            self.feed_indexes()
+        if busy:
+            self.rx_ticks += 1
+
+        sampler = self.sampler
+        if sampler:
+            now = time.monotonic()
+            if sampler.due(now):
+                sampler.request(now)
+                self.uart.send_print()
+
+        stepper = self.stepper
+        if stepper:
+            stepper.fill(self.uart, time.monotonic())
+            if stepper.finished:
+                self.stepper = None
+                busy = True
+
+        verifier = self._verify_next
+        if verifier:
+            # asked for by ui or scripts, requested from this thread so
+            # the request goes out behind the program
+            self._verify_next = None
+            verifier.request(self.uart, time.monotonic())
+            self.verifier = verifier
+
+        verifier = self.verifier
+        if verifier:
+            verifier.check(self.uart, time.monotonic())
+            if verifier.finished:
+                self.verifier = None
+                busy = True
+
+        if self.uart.send():
+            self.tx_ticks += 1
+            busy = True
+
+        return busy
+
+    def verify(self, verifier):
+        # picked up by the worker on its next pump
+        self._verify_next = verifier
+
+    def poll(self, max_pages=1024):
+        # cheap check first, new pages are read only after a commit
+        version = self.db.data_version()
+        if version == self._version:
+            self.feed_indexes()
+            return False
+
+        lo = self.top + 1
+        pages = list(self.db.iter_range(Page, lo, lo + max_pages))
+        if len(pages) < max_pages:
+            self._version = version
+        if pages:
+            self._seen(pages)
+            self.rx_ticks += 1
+        return bool(pages)
+
+    def feed_indexes(self, pages=()):
+        for index in (self.callstack,):
+            if pages and index.count == pages[0].ndx - 1:
+                index.extend_pages(pages)
+            else:
+                # backfill earlier pages a chunk at a time
+                index.catch_up(self.db, self.top)
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def _run(self):
+        pump = self.poll if self.follow else self.pump
+        try:
+            while not self._stop.is_set():
+                if pump():
+                    with self.changed:
+                        self.changed.notify_all()
+                else:
+                    self._stop.wait(self.idle)
+        except Exception as e:
+            # reported by ui thread
+            self.error = e
+            with self.changed:
+                self.changed.notify_all()
+
+    def begin_session(self, wall=None, at=None):
+        # maps receive stamps of following pages to wall clock
+        if wall is None:
+            wall, at = time.time_ns(), time.monotonic_ns()
+        self.db.save_one(Session(wall, at))
+
+    def start(self):
+        if not self.follow:
+            self.begin_session()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        self.uart.close()
+        self.db.close()
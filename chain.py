@@ -0,0 +1,116 @@
+import hashlib
+
+from data import Chain, Page
+from archive import open_stored
+from regs import reg_names
+
+
+# hash of page n covers pages 1..n, two traces agree up to page n
+# exactly when their hashes at n are equal
+def _link(prev, page):
+    text = f'{page.pc},{page.regs}'.lower().encode(encoding='ascii')
+    return hashlib.blake2b(prev + text, digest_size=8).digest()
+
+
+def _to_int(digest):
+    # stored as sqlite integer
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def link_of(chain):
+    return chain.hash.to_bytes(8, 'big', signed=True)
+
+
+def chain_pages(prev, pages):
+    # prev is hash of the page before, b'' before the first one
+    chains = []
+    for page in pages:
+        prev = _link(prev, page)
+        chains.append(Chain(page.ndx, _to_int(prev)))
+    return chains
+
+
+def last_link(db, ndx):
+    # None when pages up to ndx were stored without hashes
+    if ndx == 0:
+        return b''
+    chain = db.find_by_ndx(Chain, ndx)
+    return link_of(chain) if chain else None
+
+
+def ensure_chain(db, batch=4096):
+    # hashes missing at the end are added, eg. for files saved before
+    top = db.count(Page)
+    lo = db.count(Chain) + 1
+    prev = last_link(db, lo - 1)
+    if prev is None:
+        return
+    for ndx in range(lo, top + 1, batch):
+        chains = chain_pages(prev, db.iter_range(Page, ndx, ndx + batch))
+        if not chains:
+            break
+        db.save_many(chains)
+        prev = link_of(chains[-1])
+
+
+class _Hashes:
+    # inputs are only read, hashes missing at the end are kept in memory
+    def __init__(self, db):
+        self.db = db
+        self.top = db.count(Page)
+        # pages up to stored have their hash in db, eg. not .rvt or .rvz
+        self.stored = min(db.count(Chain), self.top)
+        prev = last_link(db, self.stored)
+        chains = chain_pages(
+            prev, db.iter_range(Page, self.stored + 1, self.top + 1)
+        )
+        self._hashes = [chain.hash for chain in chains]
+
+    def at(self, ndx):
+        if ndx > self.stored:
+            return self._hashes[ndx - self.stored - 1]
+        return self.db.find_by_ndx(Chain, ndx).hash
+
+
+def first_divergence(a, b):
+    # first page that differs, None for equal traces
+    ha, hb = _Hashes(a), _Hashes(b)
+    lo, hi = 1, min(ha.top, hb.top)
+    if hi == 0 or ha.at(hi) == hb.at(hi):
+        if ha.top == hb.top:
+            return None
+        return hi + 1
+    # page hi differs, look for the first one
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if ha.at(mid) == hb.at(mid):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _values(page):
+    if page is None:
+        return ['-'] * 33
+    return [page.pc] + page.regs.split(',')[:32]
+
+
+def diff(src_a, src_b):
+    a, b = open_stored(src_a), open_stored(src_b)
+    try:
+        ndx = first_divergence(a, b)
+        if ndx is None:
+            print(f'equal, {a.count(Page)} pages')
+            return
+        page_a = a.find_by_ndx(Page, ndx)
+        page_b = b.find_by_ndx(Page, ndx)
+        print(f'first difference at page {ndx}')
+        print(f'{"":6}{src_a[-12:]:>12}  {src_b[-12:]:>12}')
+        names = ['pc'] + reg_names
+        for name, va, vb in zip(names, _values(page_a), _values(page_b)):
+            if name == 'pc' or va.lower() != vb.lower():
+                print(f'{name:6}{va:>12}  {vb:>12}')
+    finally:
+        a.close()
+        b.close()
@@ -1,34 +1,65 @@
+import bisect
+import os
+import pathlib
 import sqlite3
+import tempfile
+import threading
+import time
 
 from collections import namedtuple
 
 
 Page = namedtuple('Page', 'ndx pc regs')
 Instr = namedtuple('Instr', 'loc code src')
+Sym = namedtuple('Sym', 'loc name')
 Diff = namedtuple('Diff', 'ndx regs')
+# host receive time of a page, monotonic ns
+Stamp = namedtuple('Stamp', 'ndx at')
+# wall clock (unix ns) and monotonic ns at the start of a capture
+Session = namedtuple('Session', 'wall at')
+# hash of pages 1..ndx, see chain.py
+Chain = namedtuple('Chain', 'ndx hash')
+# pages first..last were imported from src
+Run = namedtuple('Run', 'ndx src first last')
+
+Match = namedtuple('Match', 'loc src sym')
 
 _EntSpec = namedtuple(
     '_EntSpec',
-    'table fields init find_all find_ndx count save drop_all drop_ndx'
+    'table fields init find_all find_ndx find_range count save drop_all drop_ndx'
 )
 
 
-_specs = {}
-
-
-def _get_spec(con, ent_type):
-    return _specs.get(ent_type) or _create_spec(con, ent_type)
+_has_table = 'SELECT 1 FROM main.sqlite_master WHERE type = \'table\' AND name = ?'
 
 
-def _create_spec(con, ent_type):
+def _create_spec(con, ent_type, stored=False):
     table = ent_type.__name__
     fields = ent_type._fields
     field_arg = ','.join('?' * len(fields))
     field_def = ','.join(fields)
-
-    init = f'CREATE TABLE IF NOT EXISTS {table}({field_def})'
+    # entities without ndx field are ranged by insertion order
+    key = 'ndx' if 'ndx' in fields else 'rowid'
+
+    init = [f'CREATE TABLE IF NOT EXISTS {table}({field_def})']
+    if key == 'ndx':
+        init.append(
+            f'CREATE INDEX IF NOT EXISTS {table}_ndx ON {table}(ndx)'
+        )
+    if 'pc' in fields:
+        init.append(
+            f'CREATE INDEX IF NOT EXISTS {table}_pc ON {table}(pc, ndx)'
+        )
+    if 'at' in fields:
+        init.append(
+            f'CREATE INDEX IF NOT EXISTS {table}_at ON {table}(at)'
+        )
     find_all = f'SELECT {field_def} FROM {table}'
     find_ndx = f'SELECT {field_def} FROM {table} WHERE ndx = ?'
+    find_range = (
+        f'SELECT {field_def} FROM {table} '
+        f'WHERE {key} >= ? AND {key} < ? ORDER BY {key}'
+    )
     count = f'SELECT COUNT(*) FROM {table}'
     save = f'INSERT INTO {table} VALUES ({field_arg})'
     drop_all = f'DELETE FROM {table}'
@@ -36,84 +67,518 @@ def _create_spec(con, ent_type):
 
     ent_spec = _EntSpec(
         table, fields, init, 
-        find_all, find_ndx, 
+        find_all, find_ndx, find_range,
         count, save,
         drop_all, drop_ndx
     )
 
     cur = con.cursor()
-    cur.execute(ent_spec.init)
+    if stored:
+        # trace is only read, missing tables are kept in memory and
+        # nothing is indexed
+        cur.execute(_has_table, (table,))
+        if not cur.fetchone():
+            cur.execute(f'CREATE TEMP TABLE IF NOT EXISTS {table}({field_def})')
+        return ent_spec
+
+    cur.execute(f'DROP TABLE IF EXISTS temp.{table}')
+    for stmt in ent_spec.init:
+        cur.execute(stmt)
 
-    _specs[ent_type] = ent_spec
     return ent_spec
 
 
+_text_init = (
+    'CREATE VIRTUAL TABLE IF NOT EXISTS {}.InstrText '
+    'USING fts5(loc UNINDEXED, src, sym, tokenize="unicode61 tokenchars \'_.\'")'
+)
+_text_search = (
+    'SELECT loc, src, sym FROM InstrText WHERE InstrText MATCH ? '
+    'ORDER BY rank LIMIT ?'
+)
+_pc_next = 'SELECT ndx FROM Page WHERE pc IN (?, ?) AND ndx > ? ORDER BY ndx LIMIT 1'
+_pc_count = 'SELECT COUNT(*) FROM Page WHERE pc IN (?, ?)'
+_at_next = 'SELECT ndx FROM Stamp WHERE at >= ? ORDER BY at LIMIT 1'
+_at_gaps = (
+    'SELECT COUNT(gap), AVG(gap), MIN(gap), MAX(gap), '
+    'SUM(gap > ?) FROM ('
+    'SELECT at - LAG(at) OVER (ORDER BY ndx) AS gap FROM Stamp '
+    'WHERE ndx >= ? AND ndx < ?)'
+)
+_at_stalls = (
+    'SELECT ndx, gap FROM ('
+    'SELECT ndx, at - LAG(at) OVER (ORDER BY ndx) AS gap FROM Stamp) '
+    'WHERE gap > ? ORDER BY gap DESC LIMIT ?'
+)
+
+Gaps = namedtuple('Gaps', 'count mean min max stalls')
+
+_src_tables = 'SELECT name FROM src.sqlite_master WHERE type = \'table\''
+# pages and stamps are renumbered past the last page already stored
+_import_pages = 'INSERT INTO Page SELECT ndx + ?, pc, regs FROM src.Page'
+# receive times of other runs or boards are on their own monotonic clock,
+# they are moved to wall clock and from there to the clock used here
+_import_stamps = (
+    'INSERT INTO Stamp SELECT ndx, at FROM ('
+    'SELECT st.ndx + ? AS ndx, st.at + ('
+    'SELECT s.wall - s.at FROM src.Session s WHERE s.at <= st.at '
+    'ORDER BY s.at DESC LIMIT 1) - ? AS at FROM src.Stamp st) '
+    'WHERE at IS NOT NULL'
+)
+_last_session = 'SELECT wall, at FROM Session ORDER BY at DESC LIMIT 1'
+_first_session = 'SELECT wall, at FROM src.Session ORDER BY at LIMIT 1'
+
+
+def sym_lookup(syms):
+    named = sorted((int(sym.loc, 16), sym.name) for sym in syms)
+    sym_locs = [loc for loc, _ in named]
+    sym_names = [name for _, name in named]
+
+    def lookup(loc):
+        i = bisect.bisect_right(sym_locs, loc) - 1
+        return sym_names[i] if i >= 0 else '?'
+
+    return lookup
+
+
+def scan_prog(instrs, syms, text, limit=15):
+    # linear fallback for stores without a text index
+    sym_of = sym_lookup(syms)
+    terms = text.lower().split()
+    matches = []
+    for instr in instrs:
+        sym = sym_of(int(instr.loc, 16))
+        line = f'{instr.src} {sym}'.lower()
+        if terms and all(term in line for term in terms):
+            matches.append(Match(instr.loc, instr.src, sym))
+            if len(matches) >= limit:
+                break
+    return matches
+
+
+def _text_query(text):
+    # every word is matched as a prefix, fts5 syntax is not exposed
+    terms = ['"' + term.replace('"', '""') + '"*' for term in text.split()]
+    return ' '.join(terms)
+
+
+def _pc_keys(pc):
+    key = f'{pc:08x}'
+    return key, key.upper()
+
+
 class Db:
     def __init__(self, con):
         self._con = con
+        # specs are per connection, each one has to create its own tables
+        self._specs = {}
+        self._counts = {}
+        # shared by capture worker and ui thread
+        self._lock = threading.RLock()
+        self._indexed = False
+        self._read_only = False
+        # opened to be read, tables and indexes are made on first write
+        self._stored = False
+        self._created = set()
+        self._memory = False
+        # removed on close
+        self._scratch = None
 
     @classmethod
     def to_file(cls, filename):
-        return Db(sqlite3.connect(filename))
+        return Db(sqlite3.connect(filename, check_same_thread=False))
+
+    @classmethod
+    def stored(cls, filename):
+        # trace saved before, left as it is unless written to
+        db = Db.to_file(filename)
+        db._stored = True
+        return db
 
     @classmethod
     def in_memory(cls):
-        return Db(sqlite3.connect(':memory:'))
+        db = Db(sqlite3.connect(':memory:', check_same_thread=False))
+        db._memory = True
+        return db
 
-    def save_one(self, ent):
-        ent_spec = _get_spec(self._con, type(ent))
+    @classmethod
+    def scratch(cls):
+        # temporary file, nothing has to survive a crash
+        fd, filename = tempfile.mkstemp(prefix='rivctl-', suffix='.db')
+        os.close(fd)
+        db = Db.to_file(filename)
+        db._con.execute('PRAGMA journal_mode=OFF')
+        db._con.execute('PRAGMA synchronous=OFF')
+        db._scratch = filename
+        return db
+
+    @classmethod
+    def shared(cls, filename):
+        # readers never block the writer in wal mode, commits skip fsync
+        db = Db.to_file(filename)
+        db._con.execute('PRAGMA journal_mode=WAL')
+        db._con.execute('PRAGMA synchronous=NORMAL')
+        # tables have to exist before anyone attaches
+        for ent_type in (Page, Instr, Sym, Stamp, Session, Chain):
+            db._spec(ent_type)
+        db._con.commit()
+        return db
+
+    @classmethod
+    def attach(cls, filename):
+        uri = pathlib.Path(filename).absolute().as_uri() + '?mode=ro'
+        db = Db(sqlite3.connect(uri, uri=True, check_same_thread=False))
+        # counts change under our feet, nothing can be written either
+        db._read_only = True
+        db._stored = True
+        return db
+
+    def _spec(self, ent_type, write=False):
+        ent_spec = self._specs.get(ent_type)
+        if not ent_spec or (write and ent_type not in self._created):
+            stored = self._stored and not write
+            ent_spec = _create_spec(self._con, ent_type, stored)
+            self._specs[ent_type] = ent_spec
+            if not stored:
+                self._created.add(ent_type)
+        return ent_spec
+
+    def _bump_count(self, ent_type, by):
+        if ent_type in self._counts:
+            self._counts[ent_type] += by
 
-        cur = self._con.cursor()
-        cur.execute(ent_spec.save, tuple(ent))
-        self._con.commit()
+    def save_one(self, ent):
+        with self._lock:
+            ent_spec = self._spec(type(ent), write=True)
+
+            cur = self._con.cursor()
+            cur.execute(ent_spec.save, tuple(ent))
+            self._con.commit()
+            self._bump_count(type(ent), 1)
+
+    def save_many(self, ents):
+        self.save_batch(ents)
+
+    def save_batch(self, *ent_lists):
+        # lists of different entity types, readers see all or none of them
+        ent_lists = [ents for ents in map(list, ent_lists) if ents]
+        if not ent_lists:
+            return
+
+        with self._lock:
+            ent_specs = [
+                self._spec(type(ents[0]), write=True) for ents in ent_lists
+            ]
+
+            # single transaction for the whole batch
+            with self._con:
+                cur = self._con.cursor()
+                for ent_spec, ents in zip(ent_specs, ent_lists):
+                    cur.executemany(ent_spec.save, ents)
+            for ents in ent_lists:
+                self._bump_count(type(ents[0]), len(ents))
 
     def drop_all(self, ent_type):
-        ent_spec = _get_spec(self._con, ent_type)
+        with self._lock:
+            ent_spec = self._spec(ent_type, write=True)
 
-        cur = self._con.cursor()
-        cur.execute(ent_spec.drop_all)
-        self._con.commit()
+            cur = self._con.cursor()
+            cur.execute(ent_spec.drop_all)
+            self._con.commit()
+            self._counts[ent_type] = 0
 
     def drop_by_ndx(self, ent_type, ndx):
-        ent_spec = _get_spec(self._con, ent_type)
+        with self._lock:
+            ent_spec = self._spec(ent_type, write=True)
 
-        cur = self._con.cursor()
-        cur.execute(ent_spec.drop_ndx, (ndx,))
-        self._con.commit()
+            cur = self._con.cursor()
+            cur.execute(ent_spec.drop_ndx, (ndx,))
+            self._con.commit()
+            self._counts.pop(ent_type, None)
 
     def find_all(self, ent_type):
-        ent_spec = _get_spec(self._con, ent_type)
+        with self._lock:
+            ent_spec = self._spec(ent_type)
 
-        cur = self._con.cursor()
-        cur.execute(ent_spec.find_all)
-        return [ent_type._make(row) for row in cur.fetchall()]
+            cur = self._con.cursor()
+            cur.execute(ent_spec.find_all)
+            rows = cur.fetchall()
+        return [ent_type._make(row) for row in rows]
 
     def find_by_ndx(self, ent_type, ndx):
-        ent_spec = _get_spec(self._con, ent_type)
+        with self._lock:
+            ent_spec = self._spec(ent_type)
 
-        cur = self._con.cursor()
-        cur.execute(ent_spec.find_ndx, (ndx,))
-        row = cur.fetchone()
+            cur = self._con.cursor()
+            cur.execute(ent_spec.find_ndx, (ndx,))
+            row = cur.fetchone()
         if row:
             return ent_type._make(row)
         
         return None
 
+    def iter_range(self, ent_type, lo, hi, batch=256):
+        with self._lock:
+            ent_spec = self._spec(ent_type)
+
+            cur = self._con.cursor()
+            cur.execute(ent_spec.find_range, (lo, hi))
+        while True:
+            # lock is not held between batches
+            with self._lock:
+                rows = cur.fetchmany(batch)
+            if not rows:
+                break
+            for row in rows:
+                yield ent_type._make(row)
+
     def count(self, ent_type):
-        ent_spec = _get_spec(self._con, ent_type)
+        ent_count = self._counts.get(ent_type)
+        if ent_count is not None and not self._read_only:
+            return ent_count
 
-        cur = self._con.cursor()
-        cur.execute(ent_spec.count)
-        ent_count, = cur.fetchone()
-        return ent_count
+        with self._lock:
+            ent_spec = self._spec(ent_type)
 
-    def backup(self, dst):
-        self._con.backup(dst._con)
+            cur = self._con.cursor()
+            cur.execute(ent_spec.count)
+            ent_count, = cur.fetchone()
+            self._counts[ent_type] = ent_count
+        return ent_count
 
-    def save_db(self, filename):
+    def index_prog(self):
+        sym_of = sym_lookup(self.find_all(Sym))
+        rows = [
+            (instr.loc, instr.src, sym_of(int(instr.loc, 16)))
+            for instr in self.find_all(Instr)
+        ]
+
+        # stored traces keep their text index in memory
+        schema = 'temp' if self._stored else 'main'
+        with self._lock:
+            with self._con:
+                cur = self._con.cursor()
+                cur.execute(_text_init.format(schema))
+                cur.execute(f'DELETE FROM {schema}.InstrText')
+                cur.executemany(
+                    f'INSERT INTO {schema}.InstrText VALUES (?,?,?)', rows
+                )
+            self._indexed = True
+
+    def search_prog(self, text, limit=15):
+        query = _text_query(text)
+        if not query:
+            return []
+        try:
+            if not self._indexed and not self._read_only:
+                # files saved before indexing existed get indexed on demand
+                self.index_prog()
+
+            with self._lock:
+                cur = self._con.cursor()
+                cur.execute(_text_search, (query, limit))
+                rows = cur.fetchall()
+        except sqlite3.OperationalError:
+            # sqlite built without fts5, or nothing was indexed
+            return scan_prog(
+                self.find_all(Instr), self.find_all(Sym), text, limit
+            )
+        return [Match._make(row) for row in rows]
+
+    def next_at(self, pc, after=0):
+        self._spec(Page)
+        with self._lock:
+            cur = self._con.cursor()
+            cur.execute(_pc_next, (*_pc_keys(pc), after))
+            row = cur.fetchone()
+        return row[0] if row else None
+
+    def count_at(self, pc):
+        self._spec(Page)
+        with self._lock:
+            cur = self._con.cursor()
+            cur.execute(_pc_count, _pc_keys(pc))
+            pc_count, = cur.fetchone()
+        return pc_count
+
+    def time_of(self, ndx):
+        # wall clock of a page in unix ns, None for pages without stamp
+        stamp = self.find_by_ndx(Stamp, ndx)
+        if not stamp:
+            return None
+        sessions = self.find_all(Session)
+        if not sessions:
+            return None
+        before = [s for s in sessions if s.at <= stamp.at]
+        if before:
+            session = max(before, key=lambda s: s.at)
+        else:
+            # imported from a run that started earlier
+            session = min(sessions, key=lambda s: s.at)
+        return session.wall + stamp.at - session.at
+
+    def ndx_at(self, at):
+        # index on receive time turns this into a b-tree search
+        self._spec(Stamp)
+        with self._lock:
+            cur = self._con.cursor()
+            cur.execute(_at_next, (at,))
+            row = cur.fetchone()
+        return row[0] if row else None
+
+    def ndx_at_wall(self, wall):
+        sessions = self.find_all(Session)
+        if not sessions:
+            return None
+        before = [s for s in sessions if s.wall <= wall]
+        if before:
+            session = max(before, key=lambda s: s.wall)
+        else:
+            session = min(sessions, key=lambda s: s.wall)
+        return self.ndx_at(session.at + wall - session.wall)
+
+    def gaps(self, lo=1, hi=None, stall=100000000):
+        # inter-packet latency in ns, gaps over stall are counted
+        self._spec(Stamp)
+        if hi is None:
+            hi = self.count(Page) + 1
+        with self._lock:
+            cur = self._con.cursor()
+            cur.execute(_at_gaps, (stall, lo, hi))
+            row = cur.fetchone()
+        return Gaps(row[0], row[1] or 0, row[2] or 0, row[3] or 0, row[4] or 0)
+
+    def stalls(self, stall=100000000, limit=15):
+        # longest gaps as (page ndx, gap ns), page is the one after a gap
+        self._spec(Stamp)
+        with self._lock:
+            cur = self._con.cursor()
+            cur.execute(_at_stalls, (stall, limit))
+            return cur.fetchall()
+
+    def import_from(self, filename):
+        # copied by sqlite itself, rows never pass through python, hash
+        # chains are not, they depend on all pages before, see merge
+        for ent_type in (Page, Instr, Sym, Stamp, Session, Run):
+            self._spec(ent_type, write=True)
+
+        with self._lock:
+            self._con.commit()
+            cur = self._con.cursor()
+            cur.execute('ATTACH DATABASE ? AS src', (filename,))
+            try:
+                cur.execute(_src_tables)
+                tables = {name for name, in cur.fetchall()}
+                if 'Page' not in tables:
+                    raise sqlite3.DatabaseError(f'{filename}: no pages')
+
+                with self._con:
+                    cur.execute('SELECT COALESCE(MAX(ndx), 0) FROM Page')
+                    off, = cur.fetchone()
+                    cur.execute('SELECT MAX(ndx) FROM src.Page')
+                    last, = cur.fetchone()
+                    cur.execute(_import_pages, (off,))
+                    if {'Stamp', 'Session'} <= tables:
+                        self._import_stamps(cur, off)
+
+                    # program is taken from the first file that has one
+                    for table in ('Instr', 'Sym'):
+                        cur.execute(f'SELECT COUNT(*) FROM {table}')
+                        if table in tables and cur.fetchone()[0] == 0:
+                            cur.execute(
+                                f'INSERT INTO {table} SELECT * FROM src.{table}'
+                            )
+
+                    cur.execute('SELECT COUNT(*) FROM Run')
+                    runs, = cur.fetchone()
+                    run = Run(runs + 1, filename, off + 1, off + (last or 0))
+                    cur.execute(self._spec(Run).save, run)
+            finally:
+                cur.execute('DETACH DATABASE src')
+            self._counts.clear()
+            self._indexed = False
+        return run
+
+    def _import_stamps(self, cur, off):
+        cur.execute(_last_session)
+        session = cur.fetchone()
+        if not session:
+            # nothing captured here yet, clock of the first run is taken
+            cur.execute(_first_session)
+            session = cur.fetchone()
+            if not session:
+                return
+            cur.execute(self._spec(Session).save, session)
+        wall, at = session
+        cur.execute(_import_stamps, (off, wall - at))
+
+    def data_version(self):
+        # changes whenever another connection commits to the file
+        with self._lock:
+            cur = self._con.cursor()
+            cur.execute('PRAGMA data_version')
+            version, = cur.fetchone()
+        return version
+
+    def backup(self, dst, pages=-1, on_progress=None):
+        # in steps of pages, lock is let go in between and writes made
+        # meanwhile are copied too, file only, in-memory db would restart
+        def _step(_status, remaining, total):
+            if on_progress and total > 0:
+                on_progress(1.0 - remaining / total)
+            self._lock.release()
+            time.sleep(0)
+            self._lock.acquire()
+
+        with self._lock:
+            self._con.backup(
+                dst._con, pages=pages,
+                progress=_step if pages > 0 else None, sleep=0
+            )
+
+    def snapshot(self, pages=256):
+        if self._memory:
+            # a stepped backup restarts on every write to an in-memory
+            # db, it is copied at once, in memory, which is quick
+            dst = Db.in_memory()
+            self.backup(dst)
+            return dst
+        dst = Db.scratch()
+        # other writers would restart the copy, in wal mode a single
+        # step does not hold them up
+        self.backup(dst, -1 if self._read_only else pages)
+        return dst
+
+    def save_db(self, filename, on_progress=None, pages=256):
         dst = Db.to_file(filename)
-        self.backup(dst)
-        dst.close()
+        try:
+            self.backup(dst, pages, on_progress)
+        finally:
+            dst.close()
+        if on_progress:
+            on_progress(1.0)
 
     def close(self):
         self._con.close()
+        if self._scratch:
+            os.unlink(self._scratch)
+            self._scratch = None
+
+
+DbError = sqlite3.Error
+
+
+def merge(dst, *srcs):
+    # chain.py builds on this module
+    from chain import ensure_chain
+
+    db = Db.to_file(dst)
+    try:
+        for src in srcs:
+            run = db.import_from(src)
+            print(f'{run.src}: pages {run.first}..{run.last}')
+        # imported pages are hashed again, so capture and diff go on
+        # with a full chain
+        ensure_chain(db)
+    finally:
+        db.close()
@@ -1,9 +1,11 @@
 import re
 
-from data import Instr
+from data import Instr, Sym
+from rv32 import decode_image
 
 
 _instr_pattern = re.compile(r'\s+([0-9a-f]+):\s+([0-9a-f]+)\s+(.+)')
+_sym_pattern = re.compile(r'([0-9a-f]+)\s+<(.+)>:')
 
 
 def read_prog(filename):
@@ -15,6 +17,21 @@ def read_prog(filename):
                 yield Instr(loc, code, src)
 
 
+def read_syms(filename):
+    with open(filename) as fp:
+        for line in fp.readlines():
+            maybe_match = _sym_pattern.match(line)
+            if maybe_match:
+                loc, name = maybe_match.groups()
+                yield Sym(loc, name)
+
+
+def read_image(filename, base=0):
+    # raw program image, disassembled without objdump
+    with open(filename, 'rb') as fp:
+        return decode_image(fp.read(), base)
+
+
 # def p():
 #     state = 'init'
 #     buf = ''
@@ -0,0 +1,144 @@
+import json
+import os
+import socket
+import threading
+import time
+
+
+class Latency:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def as_dict(self):
+        mean = self.total / self.count if self.count else 0.0
+        return {
+            'count': self.count,
+            'mean_ms': round(mean * 1000, 3),
+            'max_ms': round(self.max * 1000, 3),
+        }
+
+
+class Metrics:
+    def __init__(self, captures):
+        self.captures = captures
+        self.started = time.monotonic()
+        # dev -> (time, top) of previous snapshot, for pages per second
+        self._last = {
+            capture.dev: (self.started, capture.top) for capture in captures
+        }
+
+    def _rate(self, capture, now):
+        then, top = self._last[capture.dev]
+        self._last[capture.dev] = (now, capture.top)
+        if now <= then:
+            return 0.0
+        return round((capture.top - top) / (now - then), 1)
+
+    def _device(self, capture, now):
+        uart = capture.uart
+        return {
+            'rx_bytes': uart.rx_bytes,
+            'rx_packets': uart.rx_packets,
+            'framing_errors': uart.framing_errors,
+            'parse_errors': capture.parser.errors,
+            'tx_bytes': uart.tx_bytes,
+            'tx_depth': uart.tx_depth,
+            'pages': capture.top,
+            'pages_per_s': self._rate(capture, now),
+            'db_insert': capture.store_latency.as_dict(),
+            'error': str(capture.error) if capture.error else None,
+        }
+
+    def snapshot(self):
+        now = time.monotonic()
+        return {
+            'time': time.time(),
+            'uptime_s': round(now - self.started, 3),
+            'devices': {
+                str(capture.dev): self._device(capture, now)
+                for capture in self.captures
+            },
+        }
+
+
+class MetricsWriter:
+    # target is a file replaced on every write, or unix:PATH for a local
+    # socket that answers every connection with the latest snapshot
+    def __init__(self, metrics, target, interval=1.0):
+        self.metrics = metrics
+        self.target = target
+        self.interval = interval
+        self._text = '{}'
+        self._stop = threading.Event()
+        self._threads = []
+        self._sock = None
+
+    def _write(self):
+        self._text = json.dumps(self.metrics.snapshot())
+        if self._sock:
+            return
+        tmp = f'{self.target}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fp:
+            fp.write(self._text)
+            fp.write('\n')
+        os.replace(tmp, self.target)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._write()
+            except OSError:
+                # monitoring must never stop the capture
+                pass
+            self._stop.wait(self.interval)
+
+    def _serve(self):
+        while not self._stop.is_set():
+            try:
+                con, _ = self._sock.accept()
+            except OSError:
+                break
+            with con:
+                try:
+                    con.sendall(self._text.encode(encoding='utf-8') + b'\n')
+                except OSError:
+                    pass
+
+    def start(self):
+        if self.target.startswith('unix:'):
+            path = self.target[5:]
+            if os.path.exists(path):
+                os.unlink(path)
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.bind(path)
+            self._sock.listen()
+            self._threads.append(threading.Thread(target=self._serve, daemon=True))
+        self._threads.append(threading.Thread(target=self._run, daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._sock:
+            try:
+                # wakes up accept in the serving thread
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._sock.close()
+            os.unlink(self.target[5:])
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if not self._sock:
+            try:
+                self._write()
+            except OSError:
+                pass
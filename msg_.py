@@ -9,16 +9,43 @@ quit_text_ = 'quit_text_'
 help_ = 'help_'
 save_as_ = 'save_as_'
 save_as_text_ = 'save_as_text_'
+save_busy_text_ = 'save_busy_text_'
+save_error_ = 'save_error_'
+save_error_text_ = 'save_error_text_'
+saving_ = 'saving_'
 jump_to_ = 'jump_to_'
 jump_to_text_ = 'jump_to_text_'
+jump_time_ = 'jump_time_'
+jump_time_text_ = 'jump_time_text_'
+bad_time_text_ = 'bad_time_text_'
+link_stats_ = 'link_stats_'
 bad_prog_file_ = 'bad_prog_file_'
 bad_prog_file_text_ = 'bad_prog_file_text_'
 upload_preview_ = 'upload_preview_'
 upload_ = 'upload_'
 upload_hint_ = 'upload_hint_'
 uploading_ = 'upload_progress_'
+verify_ = 'verify_'
+verify_ok_text_ = 'verify_ok_text_'
+verify_bad_text_ = 'verify_bad_text_'
+verify_lost_text_ = 'verify_lost_text_'
+step_n_ = 'step_n_'
+step_n_text_ = 'step_n_text_'
+bad_steps_text_ = 'bad_steps_text_'
+stepping_ = 'stepping_'
+hot_spots_ = 'hot_spots_'
 to_page_ = 'to_page_'
+devices_ = 'devices_'
+summary_ = 'summary_'
 latest_ = 'latest_'
+find_ = 'find_'
+find_text_ = 'find_text_'
+not_found_text_ = 'not_found_text_'
+timeline_ = 'timeline_'
+callstack_ = 'callstack_'
+watch_ = 'watch_'
+watch_text_ = 'watch_text_'
+bad_watch_text_ = 'bad_watch_text_'
 fatal_error_ = 'fatal_error_'
 cancel_ = 'cancel_'
 ok_ = 'ok_'
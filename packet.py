@@ -0,0 +1,72 @@
+import sys
+
+from array import array
+from collections import namedtuple
+
+
+# pc is an int, regs are words following it (x1.. and the rest of the
+# packet), text is the packet payload with every field as 8 hex digits
+Packet = namedtuple('Packet', 'pc regs text')
+
+# pc followed by x1..x31, x0 is never sent
+min_fields = 32
+
+
+def _words(hexes):
+    words = array('I', bytes.fromhex(hexes))
+    if sys.byteorder == 'little':
+        words.byteswap()
+    return words
+
+
+class Parser:
+    def __init__(self, min_fields=min_fields):
+        self.min_fields = min_fields
+        self.packets = 0
+        # malformed packets are counted and skipped
+        self.errors = 0
+
+    def parse(self, data):
+        packet = self._parse(data)
+        if packet is None:
+            self.errors += 1
+        else:
+            self.packets += 1
+        return packet
+
+    def _parse(self, data):
+        if data[:1] != b'P':
+            return None
+        raw = data[1:].rstrip(b'\r\n')
+
+        # usual case, every field is exactly 8 hex digits
+        n, rem = divmod(len(raw) + 1, 9)
+        if rem == 0 and n >= self.min_fields and raw[8::9] == b',' * (n - 1):
+            try:
+                # fromhex skips whitespace, short result means it had some
+                words = _words(raw.replace(b',', b'').decode(encoding='ascii'))
+            except (ValueError, UnicodeDecodeError):
+                return None
+            if len(words) != n:
+                return None
+            return Packet(words[0], words[1:], raw.decode(encoding='ascii'))
+
+        return self._parse_loose(raw)
+
+    def _parse_loose(self, raw):
+        # fields without leading zeros are padded to the usual layout
+        fields = raw.split(b',')
+        if len(fields) < self.min_fields:
+            return None
+        for field in fields:
+            if not 0 < len(field) <= 8:
+                return None
+        try:
+            text = b','.join(field.rjust(8, b'0') for field in fields)
+            text = text.decode(encoding='ascii')
+            words = _words(text.replace(',', ''))
+        except (ValueError, UnicodeDecodeError):
+            return None
+        if len(words) != len(fields):
+            return None
+        return Packet(words[0], words[1:], text)
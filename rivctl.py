@@ -2,17 +2,47 @@ import sys
 
 from app import App, AppExit
 from term import run
+from data import merge
+from chain import diff
+from tracefile import convert
+from archive import pack, unpack
+from stepper import step
+from spool import reingest
+import session
 import msg_ as m
 
 
+# name: (command, min. number of args, max. number of args or None)
+_commands = {
+    'convert': (convert, 2, 2),
+    'pack': (pack, 2, 3),
+    'unpack': (unpack, 2, 2),
+    'step': (step, 3, 4),
+    'reingest': (reingest, 2, 2),
+    'merge': (merge, 2, None),
+    'diff': (diff, 2, 2),
+    'run': (session.run, 1, None),
+}
+
+
 def see_usage():
     print(m.usage_)
 
 
 def parse_args():
     is_tty = True
-    filename = None
+    attach = False
+    verify = False
+    metrics = None
+    filenames = []
+    # device: file its pages are shared through
+    shares = {}
+    share = None
+    # device: file its raw rx/tx streams are recorded to
+    spools = {}
+    spool = None
     _, *args = sys.argv
+    args = iter(args)
     for arg in args:
         if arg == '-h':
             see_usage()
@@ -20,23 +50,71 @@ def parse_args():
         if arg == '-r':
             is_tty = False
             continue
+        if arg == '--attach':
+            attach = True
+            continue
+        if arg == '-V':
+            verify = True
+            continue
+        if arg == '-M':
+            metrics = next(args, None)
+            if not metrics:
+                see_usage()
+                sys.exit(1)
+            continue
+        if arg == '-R':
+            spool = next(args, None)
+            if not spool:
+                see_usage()
+                sys.exit(1)
+            continue
+        if arg == '-w':
+            share = next(args, None)
+            if not share:
+                see_usage()
+                sys.exit(1)
+            continue
     
-        if filename is None:
-            filename = arg
+        filenames.append(arg)
+        if share:
+            shares[arg] = share
+            share = None
+        if spool:
+            spools[arg] = spool
+            spool = None
 
-    return filename, is_tty
+    return filenames, is_tty, shares, spools, attach, metrics, verify
 
 
-def loop(scr, filename, is_tty):
+def loop(scr, filenames, is_tty, shares, spools, attach, metrics, verify):
     try:
-        app = App(scr, filename, is_tty)
+        app = App(
+            scr, filenames, is_tty, shares, spools, attach, metrics, verify
+        )
         app.loop()
     except AppExit:
         sys.exit(0)
 
+def run_command(name, args):
+    command, min_args, max_args = _commands[name]
+    if len(args) < min_args or (max_args and len(args) > max_args):
+        see_usage()
+        sys.exit(1)
+    command(*args)
+
+
 def main():
-    filename, is_tty = parse_args() 
-    run(lambda scr: loop(scr, filename, is_tty))
+    if len(sys.argv) > 1 and sys.argv[1] in _commands:
+        _, name, *args = sys.argv
+        run_command(name, args)
+        sys.exit(0)
+
+    filenames, is_tty, shares, spools, attach, metrics, verify = (
+        parse_args()
+    )
+    run(lambda scr: loop(
+        scr, filenames, is_tty, shares, spools, attach, metrics, verify
+    ))
 
 
 if __name__ == '__main__':
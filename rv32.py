@@ -0,0 +1,193 @@
+import struct
+
+from functools import lru_cache
+
+from data import Instr
+from regs import reg_names
+
+
+_loads = {0: 'lb', 1: 'lh', 2: 'lw', 4: 'lbu', 5: 'lhu'}
+_stores = {0: 'sb', 1: 'sh', 2: 'sw'}
+_branches = {0: 'beq', 1: 'bne', 4: 'blt', 5: 'bge', 6: 'bltu', 7: 'bgeu'}
+_imms = {0: 'addi', 2: 'slti', 3: 'sltiu', 4: 'xori', 6: 'ori', 7: 'andi'}
+_shifts = {(1, 0x00): 'slli', (5, 0x00): 'srli', (5, 0x20): 'srai'}
+# (funct3, funct7), funct7 = 1 is the M extension
+_ops = {
+    (0, 0x00): 'add', (0, 0x20): 'sub', (1, 0x00): 'sll', (2, 0x00): 'slt',
+    (3, 0x00): 'sltu', (4, 0x00): 'xor', (5, 0x00): 'srl', (5, 0x20): 'sra',
+    (6, 0x00): 'or', (7, 0x00): 'and',
+    (0, 0x01): 'mul', (1, 0x01): 'mulh', (2, 0x01): 'mulhsu',
+    (3, 0x01): 'mulhu', (4, 0x01): 'div', (5, 0x01): 'divu',
+    (6, 0x01): 'rem', (7, 0x01): 'remu',
+}
+_csrs = {
+    1: 'csrrw', 2: 'csrrs', 3: 'csrrc', 5: 'csrrwi', 6: 'csrrsi', 7: 'csrrci'
+}
+_systems = {0x000: 'ecall', 0x001: 'ebreak', 0x302: 'mret', 0x105: 'wfi'}
+
+
+def _sext(value, bits):
+    sign = 1 << (bits - 1)
+    return (value & (sign - 1)) - (value & sign)
+
+
+def _i_imm(word):
+    return _sext(word >> 20, 12)
+
+
+def _s_imm(word):
+    return _sext(((word >> 25) << 5) | ((word >> 7) & 0x1f), 12)
+
+
+def _b_imm(word):
+    imm = (
+        ((word >> 31) & 1) << 12 |
+        ((word >> 7) & 1) << 11 |
+        ((word >> 25) & 0x3f) << 5 |
+        ((word >> 8) & 0xf) << 1
+    )
+    return _sext(imm, 13)
+
+
+def _j_imm(word):
+    imm = (
+        ((word >> 31) & 1) << 20 |
+        ((word >> 12) & 0xff) << 12 |
+        ((word >> 20) & 1) << 11 |
+        ((word >> 21) & 0x3ff) << 1
+    )
+    return _sext(imm, 21)
+
+
+def _lui(word, rd, rs1, rs2, f3):
+    return 'lui', f'{rd},0x{word >> 12:x}', None
+
+
+def _auipc(word, rd, rs1, rs2, f3):
+    return 'auipc', f'{rd},0x{word >> 12:x}', None
+
+
+def _jal(word, rd, rs1, rs2, f3):
+    imm = _j_imm(word)
+    if rd == 'zero':
+        return 'j', '', imm
+    if rd == 'ra':
+        return 'jal', '', imm
+    return 'jal', f'{rd},', imm
+
+
+def _jalr(word, rd, rs1, rs2, f3):
+    imm = _i_imm(word)
+    if f3 != 0:
+        return None
+    if rd == 'zero' and rs1 == 'ra' and imm == 0:
+        return 'ret', '', None
+    return 'jalr', f'{rd},{imm}({rs1})', None
+
+
+def _branch(word, rd, rs1, rs2, f3):
+    name = _branches.get(f3)
+    if not name:
+        return None
+    return name, f'{rs1},{rs2},', _b_imm(word)
+
+
+def _load(word, rd, rs1, rs2, f3):
+    name = _loads.get(f3)
+    if not name:
+        return None
+    return name, f'{rd},{_i_imm(word)}({rs1})', None
+
+
+def _store(word, rd, rs1, rs2, f3):
+    name = _stores.get(f3)
+    if not name:
+        return None
+    return name, f'{rs2},{_s_imm(word)}({rs1})', None
+
+
+def _op_imm(word, rd, rs1, rs2, f3):
+    name = _imms.get(f3)
+    if name:
+        imm = _i_imm(word)
+        if name == 'addi' and rs1 == 'zero':
+            if rd == 'zero' and imm == 0:
+                return 'nop', '', None
+            return 'li', f'{rd},{imm}', None
+        if name == 'addi' and imm == 0:
+            return 'mv', f'{rd},{rs1}', None
+        return name, f'{rd},{rs1},{imm}', None
+    name = _shifts.get((f3, word >> 25))
+    if not name:
+        return None
+    return name, f'{rd},{rs1},0x{(word >> 20) & 0x1f:x}', None
+
+
+def _op(word, rd, rs1, rs2, f3):
+    name = _ops.get((f3, word >> 25))
+    if not name:
+        return None
+    return name, f'{rd},{rs1},{rs2}', None
+
+
+def _misc_mem(word, rd, rs1, rs2, f3):
+    if f3 == 0:
+        return 'fence', '', None
+    if f3 == 1:
+        return 'fence.i', '', None
+    return None
+
+
+def _system(word, rd, rs1, rs2, f3):
+    if f3 == 0:
+        name = _systems.get(word >> 20)
+        return (name, '', None) if name else None
+    name = _csrs.get(f3)
+    if not name:
+        return None
+    src = rs1 if f3 < 4 else str((word >> 15) & 0x1f)
+    return name, f'{rd},0x{word >> 20:x},{src}', None
+
+
+# indexed by the major opcode, word & 0x7f
+_formats = {
+    0x37: _lui, 0x17: _auipc, 0x6f: _jal, 0x67: _jalr, 0x63: _branch,
+    0x03: _load, 0x23: _store, 0x13: _op_imm, 0x33: _op,
+    0x0f: _misc_mem, 0x73: _system,
+}
+
+
+@lru_cache(maxsize=8192)
+def _decode(word):
+    # same word always decodes the same, pc relative targets are kept
+    # as offsets and added by decode
+    fmt = _formats.get(word & 0x7f)
+    decoded = None
+    if fmt:
+        decoded = fmt(
+            word,
+            reg_names[(word >> 7) & 0x1f],
+            reg_names[(word >> 15) & 0x1f],
+            reg_names[(word >> 20) & 0x1f],
+            (word >> 12) & 0x7
+        )
+    if not decoded:
+        return '.word', f'0x{word:08x}', None
+    return decoded
+
+
+def decode(word, loc=None):
+    name, args, rel = _decode(word)
+    if rel is not None:
+        args += f'{loc + rel:x}' if loc is not None else f'.{rel:+d}'
+    return f'{name:<8}{args}'.rstrip()
+
+
+def decode_image(data, base=0):
+    # little-endian image, trailing bytes that do not form a word are dropped
+    n = len(data) // 4
+    words = struct.unpack(f'<{n}I', data[:n * 4])
+    return [
+        Instr(f'{base + i * 4:x}', f'{word:08x}', decode(word, base + i * 4))
+        for i, word in enumerate(words)
+    ]
@@ -0,0 +1,68 @@
+from collections import namedtuple
+
+from data import sym_lookup
+
+
+HotSpot = namedtuple('HotSpot', 'loc hits sym src')
+
+
+class Sampler:
+    def __init__(self, interval=0.05, timeout=1.0):
+        self.interval = interval
+        self.timeout = timeout
+        self.total = 0
+
+        # pc -> hits, pages are never stored while sampling
+        self._hist = {}
+        self._sent_at = None
+        self._recv_at = 0.0
+
+    def due(self, now):
+        # only one print request is kept in flight
+        if self._sent_at is not None:
+            return now - self._sent_at > self.timeout
+        return now - self._recv_at >= self.interval
+
+    def request(self, now):
+        self._sent_at = now
+
+    def hit(self, pc, now):
+        self._hist[pc] = self._hist.get(pc, 0) + 1
+        self.total += 1
+        self._sent_at = None
+        self._recv_at = now
+
+    def hist(self):
+        return dict(self._hist)
+
+
+def hot_spots(hist, prog, syms):
+    instrs = {int(instr.loc, 16): instr for instr in prog}
+    sym_of = sym_lookup(syms)
+
+    spots = []
+    for loc, hits in hist.items():
+        instr = instrs.get(loc)
+        src = instr.src if instr else '?'
+        spots.append(HotSpot(loc, hits, sym_of(loc), src))
+    return spots
+
+
+def by_hits(spots):
+    return sorted(spots, key=lambda spot: (-spot.hits, spot.loc))
+
+
+def by_loc(spots):
+    return sorted(spots, key=lambda spot: spot.loc)
+
+
+def by_sym(spots):
+    hits = {}
+    locs = {}
+    for spot in spots:
+        hits[spot.sym] = hits.get(spot.sym, 0) + spot.hits
+        locs[spot.sym] = min(locs.get(spot.sym, spot.loc), spot.loc)
+    return by_hits([
+        HotSpot(locs[sym], sym_hits, sym, '')
+        for sym, sym_hits in hits.items()
+    ])
@@ -0,0 +1,156 @@
+import runpy
+import sys
+
+from capture import Capture
+from data import Instr, Page, Sym
+from file import read_image, read_prog, read_syms
+from stepper import Stepper
+from store import LiveStore
+from uart import Uart
+from verify import Verifier
+from watch import Watch
+
+
+class SessionError(Exception):
+    pass
+
+
+class Driver:
+    # drives a board without ui, every call blocks until the board replied
+    def __init__(self, dev, uart=None, db=None, timeout=5.0):
+        self.timeout = timeout
+        # same bounded ring the ui uses, long runs do not fill memory
+        self.capture = Capture(
+            dev, uart or Uart.open(dev), db or LiveStore()
+        )
+        self.capture.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    @property
+    def db(self):
+        return self.capture.db
+
+    @property
+    def top(self):
+        return self.capture.top
+
+    @property
+    def last(self):
+        return self.capture.last
+
+    def _wait(self, done, timeout=None):
+        # without timeout, done has to give up on its own, eg. a stepper
+        # counts replies that never came as lost
+        capture = self.capture
+        with capture.changed:
+            # woken up by capture worker, not by polling
+            ok = capture.changed.wait_for(
+                lambda: done() or capture.error, timeout
+            )
+        if capture.error:
+            raise SessionError(f'{capture.dev}: {capture.error}')
+        if not ok:
+            raise SessionError(f'{capture.dev}: no reply')
+
+    def _after(self, top):
+        return list(self.db.iter_range(Page, top + 1, self.capture.top + 1))
+
+    def upload(self, path, verify=False):
+        if path.endswith('.bin'):
+            instrs, syms = read_image(path), []
+        else:
+            instrs, syms = list(read_prog(path)), list(read_syms(path))
+        self.db.drop_all(Instr)
+        self.db.save_many(instrs)
+        self.db.drop_all(Sym)
+        self.db.save_many(syms)
+
+        sent = []
+        self.capture.uart.send_prog(
+            [instr.code for instr in instrs], sent.append
+        )
+        if not verify:
+            # progress reaches 1.0 once the last chunk was written
+            self._wait(lambda: sent and sent[-1] >= 1.0)
+            return []
+
+        # needs firmware that answers C with block checksums
+        verifier = Verifier(instrs)
+        self.capture.verify(verifier)
+        self._wait(lambda: verifier.finished)
+        if verifier.lost:
+            raise SessionError(f'{self.capture.dev}: no checksums')
+        # indices of 64-word blocks that still differ
+        return verifier.bad
+
+    def halt(self):
+        top = self.capture.top
+        self.capture.uart.send_halt()
+        self.capture.uart.send_print()
+        self._wait(lambda: self.capture.top > top, self.timeout)
+        return self.capture.last
+
+    def start(self):
+        self.capture.uart.send_start()
+
+    def reset(self):
+        self.capture.uart.send_reset()
+
+    def step(self, n=1):
+        top = self.capture.top
+        stepper = Stepper(n, timeout=self.timeout)
+        self.capture.stepper = stepper
+        self._wait(lambda: stepper.finished)
+        if stepper.lost:
+            raise SessionError(
+                f'{self.capture.dev}: {stepper.lost} steps lost'
+            )
+        return self._after(top)
+
+    def run_until(self, pc, max_steps=100000):
+        # steps until pc is reached, returns the page or None
+        capture = self.capture
+        hits = len(capture.hits)
+        # one step at a time, nothing is in flight past the hit
+        stepper = Stepper(max_steps, window=1, timeout=self.timeout)
+        capture.watches = [Watch(f'pc == {pc}')]
+        capture.stepper = stepper
+        try:
+            self._wait(lambda: len(capture.hits) > hits or stepper.finished)
+        finally:
+            capture.stepper = None
+            capture.watches = []
+        if len(capture.hits) > hits:
+            _, ndx = capture.hits[hits]
+            return self.db.find_by_ndx(Page, ndx)
+        return None
+
+    def pages(self, lo=1, hi=None):
+        if hi is None:
+            hi = self.capture.top + 1
+        return self.db.iter_range(Page, lo, hi)
+
+    def save(self, filename):
+        self.db.save_db(filename)
+
+    def close(self):
+        self.capture.close()
+
+
+def connect(dev, **kwargs):
+    return Driver(dev, **kwargs)
+
+
+def run(script, *args):
+    # script sees its own arguments, like it was run by python itself
+    argv = sys.argv
+    sys.argv = [script, *args]
+    try:
+        runpy.run_path(script, run_name='__main__')
+    finally:
+        sys.argv = argv
@@ -0,0 +1,99 @@
+import struct
+import time
+
+from capture import Capture
+from data import Db
+from uart import Uart
+
+
+_magic = b'RVS1'
+_version = 2
+# magic, version, session start (unix ns), session start (monotonic ns)
+_header = struct.Struct('<4sHQq')
+# monotonic receive/send time (ns), direction, data length
+_chunk = struct.Struct('<qBI')
+
+RX = 0
+TX = 1
+
+
+class SpoolError(Exception):
+    pass
+
+
+class Spool:
+    def __init__(self, filename, buffering=1 << 20):
+        # append-only, chunks reach the disk in large writes
+        self._fp = open(filename, 'ab', buffering=buffering)
+        if self._fp.tell() == 0:
+            self._fp.write(_header.pack(
+                _magic, _version, time.time_ns(), time.monotonic_ns()
+            ))
+
+    def _put(self, direction, data):
+        self._fp.write(_chunk.pack(time.monotonic_ns(), direction, len(data)))
+        self._fp.write(data)
+
+    def rx(self, data):
+        self._put(RX, data)
+
+    def tx(self, data):
+        self._put(TX, data)
+
+    def close(self):
+        self._fp.close()
+
+
+def _read_header(fp):
+    head = fp.read(_header.size)
+    if len(head) < _header.size:
+        raise SpoolError('truncated spool header')
+    magic, version, wall, at = _header.unpack(head)
+    if magic != _magic or version != _version:
+        raise SpoolError('not a rivctl spool file')
+    return wall, at
+
+
+def spool_start(filename):
+    with open(filename, 'rb') as fp:
+        return _read_header(fp)
+
+
+def read_spool(filename, buffering=1 << 20):
+    with open(filename, 'rb', buffering=buffering) as fp:
+        _read_header(fp)
+        while True:
+            head = fp.read(_chunk.size)
+            if len(head) < _chunk.size:
+                # last chunk may be cut short by a crash
+                break
+            at, direction, n = _chunk.unpack(head)
+            data = fp.read(n)
+            if len(data) < n:
+                break
+            yield at, direction, data
+
+
+def reingest(src, dst, batch=4096):
+    uart = Uart.null()
+    capture = Capture(src, uart, Db.to_file(dst))
+    top = capture.top
+    start = time.perf_counter()
+    try:
+        # pages keep the receive times recorded in the spool
+        capture.begin_session(*spool_start(src))
+        # received bytes go through the same framer, parser and Db
+        for at, direction, data in read_spool(src):
+            if direction == RX:
+                uart.feed(data, at)
+                if uart.pending >= batch:
+                    capture.pump(batch)
+        while uart.pending:
+            capture.pump(batch)
+    finally:
+        capture.close()
+    took = time.perf_counter() - start
+    print(f'pages: {capture.top - top}')
+    print(f'parse errors: {capture.parser.errors}')
+    print(f'framing errors: {uart.framing_errors}')
+    print(f'took: {took:.2f} s')
@@ -0,0 +1,85 @@
+import sys
+import time
+
+from capture import Capture
+from data import Db
+from metrics import Metrics, MetricsWriter
+from uart import Uart
+
+
+class Stepper:
+    def __init__(self, total, window=16, timeout=2.0, on_step=None):
+        self.total = total
+        self.window = window
+        self.timeout = timeout
+        self.sent = 0
+        self.done = 0
+        # replies given up on after timeout
+        self.lost = 0
+        self._on_step = on_step
+        self._last = None
+
+    @property
+    def in_flight(self):
+        return self.sent - self.done - self.lost
+
+    @property
+    def finished(self):
+        return self.done + self.lost >= self.total
+
+    def fill(self, uart, now):
+        if self._last is None:
+            self._last = now
+        if self.in_flight > 0 and now - self._last > self.timeout:
+            self.lost += self.in_flight
+            self._last = now
+            self._notify()
+
+        # queued pairs are coalesced into a single write by Uart.send
+        while self.in_flight < self.window and self.sent < self.total:
+            uart.send_step()
+            uart.send_print()
+            self.sent += 1
+
+    def cancel(self):
+        # replies already asked for still count, nothing more is sent
+        self.total = self.sent
+        if self.total:
+            self._notify()
+
+    def hit(self, now):
+        if self.in_flight > 0:
+            self.done += 1
+            self._last = now
+            self._notify()
+
+    def _notify(self):
+        if self._on_step:
+            self._on_step((self.done + self.lost) / self.total)
+
+
+def step(dev, n, out, metrics=None):
+    capture = Capture(dev, Uart.open(dev), Db.in_memory())
+    stepper = Stepper(int(n))
+    capture.stepper = stepper
+    writer = None
+    if metrics:
+        writer = MetricsWriter(Metrics([capture]), metrics)
+        writer.start()
+    capture.start()
+    try:
+        while not stepper.finished and not capture.error:
+            print(f'\rstep {stepper.done:8}/{stepper.total}', end='')
+            time.sleep(0.1)
+        print(f'\rstep {stepper.done:8}/{stepper.total}')
+        if stepper.lost:
+            print(f'lost: {stepper.lost}')
+        capture.stop()
+        capture.db.save_db(out)
+    finally:
+        if writer:
+            writer.stop()
+        capture.close()
+    if capture.error:
+        print(f'error: {capture.error}')
+        sys.exit(1)
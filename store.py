@@ -0,0 +1,231 @@
+import threading
+
+from data import Db, Page
+from tracefile import pack_pages, record_size, unpack_pages
+
+
+class LiveStore:
+    # recent pages are kept packed in a ring, every entity is written to
+    # a scratch file in background and pages leave the ring once there
+    def __init__(self, ring=65536, batch=4096):
+        self._disk = Db.scratch()
+        self._size = ring
+        self._batch = batch
+        self._ring = bytearray(ring * record_size)
+        # pages lo..top are in the ring, pages up to spilled are on disk
+        self._lo = 1
+        self._top = 0
+        self._spilled = 0
+
+        self._queue = []
+        # batches queued and written so far
+        self._queued = 0
+        self._written = 0
+        self._closed = False
+        # set when writing to disk failed, raised to every caller after
+        self.error = None
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._spill, daemon=True)
+        self._thread.start()
+
+    def _spill(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                queue, self._queue = self._queue, []
+
+            top = None
+            try:
+                for ent_lists in queue:
+                    # a batch keeps being a single transaction on disk
+                    self._disk.save_batch(*ent_lists)
+                    for ents in ent_lists:
+                        if type(ents[0]) is Page:
+                            top = ents[-1].ndx
+            except Exception as e:
+                # nothing is spilled after, waiting writers are woken up
+                with self._cond:
+                    self.error = e
+                    self._cond.notify_all()
+                return
+
+            with self._cond:
+                if top is not None:
+                    self._spilled = top
+                self._written += len(queue)
+                self._cond.notify_all()
+
+    def _check(self):
+        # called with _cond held
+        if self.error:
+            raise self.error
+
+    def _enqueue(self, ent_lists):
+        # called with _cond held
+        self._check()
+        self._queue.append(ent_lists)
+        self._queued += 1
+        self._cond.notify_all()
+
+    def flush(self):
+        # waits until everything saved so far is on disk, batches saved
+        # meanwhile are not waited for
+        with self._cond:
+            queued = self._queued
+            while self._written < queued:
+                self._check()
+                self._cond.wait()
+
+    def _slot(self, ndx):
+        return (ndx - 1) % self._size * record_size
+
+    def _put(self, pages, others=()):
+        with self._cond:
+            # ring slots are reused only after their pages were spilled
+            while pages[-1].ndx - self._spilled > self._size:
+                self._check()
+                self._cond.wait()
+            data = pack_pages(pages)
+            for i, page in enumerate(pages):
+                off = self._slot(page.ndx)
+                self._ring[off:off + record_size] = (
+                    data[i * record_size:(i + 1) * record_size]
+                )
+            self._top = pages[-1].ndx
+            self._lo = max(self._lo, self._top - self._size + 1)
+            self._enqueue([pages, *others])
+
+    def _from_ring(self, lo, hi):
+        off = self._slot(lo)
+        end = off + (hi - lo) * record_size
+        if end <= len(self._ring):
+            return bytes(self._ring[off:end])
+        return bytes(self._ring[off:]) + bytes(self._ring[:end - len(self._ring)])
+
+    def count(self, ent_type):
+        if ent_type is Page:
+            return self._top
+        self.flush()
+        return self._disk.count(ent_type)
+
+    def find_by_ndx(self, ent_type, ndx):
+        if ent_type is Page:
+            with self._cond:
+                if self._lo <= ndx <= self._top:
+                    page, = unpack_pages(ndx, self._from_ring(ndx, ndx + 1))
+                    return page
+        else:
+            self.flush()
+        return self._disk.find_by_ndx(ent_type, ndx)
+
+    def find_all(self, ent_type):
+        if ent_type is Page:
+            return list(self.iter_range(Page, 1, self._top + 1))
+        self.flush()
+        return self._disk.find_all(ent_type)
+
+    def iter_range(self, ent_type, lo, hi, batch=4096):
+        if ent_type is not Page:
+            self.flush()
+            yield from self._disk.iter_range(ent_type, lo, hi)
+            return
+
+        hi = min(hi, self._top + 1)
+        ndx = max(lo, 1)
+        while ndx < hi:
+            end = min(ndx + batch, hi)
+            with self._cond:
+                ring_lo = self._lo
+                data = None
+                if ndx >= ring_lo:
+                    data = self._from_ring(ndx, end)
+            if data is not None:
+                yield from unpack_pages(ndx, data)
+            else:
+                # older pages left the ring, they are on disk for sure
+                end = min(end, ring_lo)
+                yield from self._disk.iter_range(Page, ndx, end)
+            ndx = end
+
+    def save_one(self, ent):
+        self.save_many([ent])
+
+    def save_many(self, ents):
+        self.save_batch(ents)
+
+    def save_batch(self, *ent_lists):
+        ent_lists = [ents for ents in map(list, ent_lists) if ents]
+        pages = [ents for ents in ent_lists if type(ents[0]) is Page]
+        others = [ents for ents in ent_lists if type(ents[0]) is not Page]
+        if not pages:
+            if others:
+                with self._cond:
+                    self._enqueue(others)
+            return
+        # pages that do not fit the ring at once go ahead in parts
+        pages, = pages
+        lo = 0
+        while len(pages) - lo > self._size:
+            self._put(pages[lo:lo + self._size])
+            lo += self._size
+        self._put(pages[lo:], others)
+
+    def drop_all(self, ent_type):
+        self.flush()
+        self._disk.drop_all(ent_type)
+
+    # queries below run on the scratch file once it caught up
+
+    def index_prog(self):
+        self.flush()
+        self._disk.index_prog()
+
+    def search_prog(self, text, limit=15):
+        self.flush()
+        return self._disk.search_prog(text, limit)
+
+    def next_at(self, pc, after=0):
+        self.flush()
+        return self._disk.next_at(pc, after)
+
+    def count_at(self, pc):
+        self.flush()
+        return self._disk.count_at(pc)
+
+    def time_of(self, ndx):
+        self.flush()
+        return self._disk.time_of(ndx)
+
+    def ndx_at_wall(self, wall):
+        self.flush()
+        return self._disk.ndx_at_wall(wall)
+
+    def gaps(self, lo=1, hi=None, stall=100000000):
+        self.flush()
+        return self._disk.gaps(lo, hi, stall)
+
+    def stalls(self, stall=100000000, limit=15):
+        self.flush()
+        return self._disk.stalls(stall, limit)
+
+    def snapshot(self):
+        # copy is made on disk too, memory use stays flat, it goes in
+        # steps so pages keep being spilled while it is made
+        self.flush()
+        dst = Db.scratch()
+        self._disk.backup(dst, pages=256)
+        return dst
+
+    def save_db(self, filename, on_progress=None):
+        self.flush()
+        self._disk.save_db(filename, on_progress)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._disk.close()
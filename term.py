@@ -3,6 +3,8 @@ import signal
 import pathlib
 import sys
 
+from regs import reg_names
+
 
 _color_inits = []
 
@@ -169,12 +171,28 @@ class Window:
             return 'move', (-1, 0)
         elif key == curses.KEY_RIGHT:
             return 'move', (+1, 0)
+        elif key == curses.KEY_PPAGE:
+            return 'page', 'up'
+        elif key == curses.KEY_NPAGE:
+            return 'page', 'down'
+        elif key == curses.KEY_HOME:
+            return 'page', 'home'
+        elif key == curses.KEY_END:
+            return 'page', 'end'
         else:
             return 'key', chr(key)
 
     def refresh(self):
         self._win.refresh()
 
+    def stage(self):
+        # copy whole window to virtual screen, output happens in flush
+        self._win.touchwin()
+        self._win.noutrefresh()
+
+    def blit(self, src):
+        src._win.overwrite(self._win)
+
     def erase(self):
         self._win.erase()
 
@@ -205,7 +223,7 @@ def popup(title, message, btns):
 
     def redraw():
         win.draw_btns(btns, h - 2, btn_sel)
-        win.refresh()
+        win.stage()
 
     def update(poll):
         nonlocal accept_ev, btn_sel
@@ -246,7 +264,7 @@ def dialog(title, message, btns):
     def redraw():
         win.draw_input(text, h - 4, input_sel)
         win.draw_btns(btns, h - 2, btn_sel if not input_sel else -1)
-        win.refresh()
+        win.stage()
 
     def update(poll):
         nonlocal accept_ev, input_sel, btn_sel, text
@@ -310,7 +328,7 @@ def pager(title, text, sz, btns, fg=bkwh):
         if bottom > 0:
             win.draw_scroll_bar((w - 3, 2), vh, 1, row / bottom, fg())
         win.draw_btns(btns, h - 2, btn_sel)
-        win.refresh()
+        win.stage()
 
     def update(poll):
         nonlocal accept_ev, row, btn_sel
@@ -365,7 +383,7 @@ def menu(pos, acts):
 
     def redraw():
         _draw_acts(1, act_sel)
-        win.refresh()
+        win.stage()
 
     def update(poll):
         nonlocal accept_ev, act_sel
@@ -438,7 +456,7 @@ def picker(title, message, sz, act, fc=whbk, dc=cybk, sc=bkcy, init='.'):
         if bottom > 0:
             win.draw_scroll_bar((w - 3, 2), vh, 1, row / bottom, fc())
         win.txt(message[w-4:], (3, h - 3), fc())
-        win.refresh()
+        win.stage()
 
     def _get_parent(p):
         return p.joinpath(pathlib.Path('..'))
@@ -496,6 +514,105 @@ def picker(title, message, sz, act, fc=whbk, dc=cybk, sc=bkcy, init='.'):
     return redraw, update, close
 
 
+def timeline(title, sz, names, count, query, act, fg=bkwh, sc=bkcy):
+    vw, vh = sz
+    win = Window.of(title, (vw + 4, vh + 6), (2, 2), keypad=True)
+
+    accept_ev = False
+    series = 0
+    # shown page range [lo, hi), follows the trace until zoomed or panned
+    lo, hi = 1, 1
+    follow = True
+    col = vw - 1
+    cols = []
+
+    def _bar(mn, mx, vmin, scale):
+        y0 = int((mn - vmin) * scale)
+        y1 = int((mx - vmin) * scale)
+        return vh - 1 - y1, vh - 1 - y0
+
+    def redraw():
+        nonlocal lo, hi, col, cols
+        top = count(series)
+        span = hi - lo
+        if follow:
+            lo, hi = 1, top + 1
+        elif hi > top + 1:
+            hi = top + 1
+            lo = max(hi - span, 1)
+        cols = query(series, lo, hi, vw)
+        sel = min(col, len(cols) - 1)
+
+        win.box(' ', (_hp, 2), (vw, vh + 3), fg())
+        if cols:
+            vmin = min(c[1] for c in cols)
+            vmax = max(c[2] for c in cols)
+            scale = (vh - 1) / (vmax - vmin) if vmax > vmin else 0
+            for x, (_, mn, mx, _) in enumerate(cols):
+                y0, y1 = _bar(mn, mx, vmin, scale)
+                color = sc() if x == sel else fg()
+                for y in range(vh):
+                    char = '█' if y0 <= y <= y1 else ' '
+                    if x == sel and char == ' ':
+                        char = '│'
+                    win.txt(char, (_hp + x, 2 + y), color)
+
+            ndx, mn, mx, last = cols[sel]
+            end = cols[sel + 1][0] if sel + 1 < len(cols) else hi
+            win.txt(
+                f'{names[series]:<5} {ndx}..{end - 1}  '
+                f'min {mn:08x} max {mx:08x} last {last:08x}'[:vw],
+                (_hp, vh + 3),
+                fg()
+            )
+        win.txt(f' {lo}..{hi - 1} '[:vw], (_hp, vh + 4), fg())
+        win.stage()
+
+    def update(poll):
+        nonlocal accept_ev, series, lo, hi, follow, col
+        ev, arg = poll
+        if not accept_ev:
+            if ev == 'empty':
+                accept_ev = True
+        elif ev == 'move' and cols:
+            assert isinstance(arg, tuple)
+            mx, my = arg
+            n = len(cols)
+            col = min(col, n - 1) + mx
+            span = hi - lo
+            if col < 0 or col >= n:
+                # pan by a quarter of the view at the edges
+                lo = max(lo + mx * max(span // 4, 1), 1)
+                hi = lo + span
+                follow = False
+                col = max(min(col, n - 1), 0)
+            if my:
+                # zoom around the selected column
+                at = cols[col][0]
+                span = max(span // 2 if my > 0 else span * 2, vw)
+                lo = max(at - span * col // n, 1)
+                hi = lo + span
+                follow = False
+        elif ev == 'key':
+            assert isinstance(arg, str)
+            if arg == 'esc':
+                return 'quit'
+            elif arg == 'tab':
+                # new series starts over with the whole trace
+                series = (series + 1) % len(names)
+                follow = True
+            elif arg == 'L':
+                follow = True
+            elif arg == 'enter' and cols:
+                return act(cols[min(col, len(cols) - 1)][0])
+        return 'ok'
+
+    def close():
+        win.erase()
+
+    return redraw, update, close
+
+
 def progress(title, vw, pb=grwh):
     # empty message, will be drawn later
     win = Window.of(title, (vw + 8, 6), (2, 2), keypad=True)
@@ -514,7 +631,7 @@ def progress(title, vw, pb=grwh):
         win.txt('■' * bw, (2 + pw, 2), bkwh())
         win.txt(f' {pct:3}%', (vw, 2), pb())
         win.draw_btns([('hide', lambda _: _)], 4, 0)
-        win.refresh()
+        win.stage()
 
     def update(poll):
         nonlocal timeout
@@ -541,7 +658,9 @@ def abort(win, title, message, exc_creator):
     try:
         redraw, update, _ = popup(title, message, [('exit', None)])
         while update(win.poll()) != 'quit':
+            win.stage()
             redraw()
+            flush()
     except WindowError:
         print(f'exit: {title}')
         for line in message.split('\n'):
@@ -560,16 +679,51 @@ def ensure_vga(win):
         )
 
 
-_regs_names = [
-    'zero', 'ra', 'sp', 'gp', 'tp', 't0', 't1', 't2',
-    's0', 's1', 'a0', 'a1', 'a2', 'a3', 'a4', 'a5',
-    'a6', 'a7', 's2', 's3', 's4', 's5', 's5', 's7',
-    's8', 's9', 's10', 's11', 't3', 't4', 't5', 't6'
-]
+def flush():
+    curses.doupdate()
 
 
-def main_view(win, page, prog, tab):
-    win.bg(whbl())
+_chromes = {}
+
+
+def _chrome(size, has_page, has_stack):
+    # outlines and labels never change, they are drawn once off-screen
+    key = (size, has_page, has_stack)
+    chrome = _chromes.get(key)
+    if chrome:
+        return chrome
+
+    w, h = size
+    chrome = Window(curses.newpad(h, w))
+    chrome._win.bkgd(' ', whbl())
+
+    rx = 2
+    mx = 38
+    chrome.draw_outline(
+        (rx, 4), (32, 18), whbl(), 
+        ('regfile', None)
+    )
+    if has_stack:
+        chrome.draw_outline((mx, 4), (40, 8), whbl(), ('callstack', None))
+    else:
+        chrome.draw_outline(
+            (mx, 4), (40, 8), whbl(),
+            ('datamem', None), 
+            ('offset: 00000000' if has_page else 'offset:      N/A', None) 
+        )
+    chrome.draw_outline(
+        (mx, 14), (40, 8), whbl(), 
+        ('progmem', None),
+        ('offset: 00000044' if has_page else 'offset:      N/A', None)
+    )
+
+    _chromes[key] = chrome
+    return chrome
+
+
+def main_view(win, page, prog, tab, stack=None):
+    # stack replaces datamem pane, it is a list of (pc, symbol) pairs
+    win.blit(_chrome(win.size, page is not None, stack is not None))
 
     rx = 2
     mx = 38
@@ -579,7 +733,7 @@ def main_view(win, page, prog, tab):
         regs_vals = page.regs.split(',')[:32]
         win.txt('pc    ', (rx + 1, oy), yebl())
         win.txt(f'{page.pc:8}', (rx + 7, oy), whbl())
-        for i, reg_name, reg_val in zip(range(32), _regs_names, regs_vals):
+        for i, reg_name, reg_val in zip(range(32), reg_names, regs_vals):
             x = (0 if i < 16 else 16) + rx + 1
             y = i % 16 + oy + 2
             win.txt(f'{reg_name:6}', (x, y), yebl())
@@ -587,7 +741,15 @@ def main_view(win, page, prog, tab):
     else:
         win.txt('no pages yet', (rx + 2, 6), whbl())
 
-    if page:
+    if page and stack is not None:
+        for i, (pc, sym) in enumerate(stack[:8]):
+            y = i + oy
+            win.txt(f'#{i:<2}', (mx + 1, y), yebl())
+            win.txt(f'{pc:08X}', (mx + 5, y), yebl())
+            win.txt(sym[:25], (mx + 15, y), whbl())
+        if not stack:
+            win.txt('not in a call', (mx + 2, oy), whbl())
+    elif page:
         data_vals = ['00000000'] * 32
         for i, data_val in zip(range(32), data_vals):
             x = i % 4 * 10 + mx + 1
@@ -615,21 +777,6 @@ def main_view(win, page, prog, tab):
                 win.txt('-', (mx + 11, y), whbl())
     else:
         win.txt('no pages yet', (mx + 2, 16), whbl())
-        
-    win.draw_outline(
-        (rx, 4), (32, 18), whbl(), 
-        ('regfile', None)
-    )
-    win.draw_outline(
-        (mx, 4), (40, 8), whbl(),
-        ('datamem', None), 
-        ('offset: 00000000' if page else 'offset:      N/A', None) 
-    )
-    win.draw_outline(
-        (mx, 14), (40, 8), whbl(), 
-        ('progmem', None),
-        ('offset: 00000044' if page else 'offset:      N/A', None)
-    )
 
 
 def task_bar(win, uart_model):
@@ -660,6 +807,7 @@ def task_bar(win, uart_model):
     _draw_hint('a', 'Cycle', 20)
     _draw_hint('s', 'Step', 30)
     _draw_hint('r', 'Reset', 40)
+    _draw_hint('x', 'Prof', 50)
 
 
 _ctl_mode_colors = {
@@ -667,6 +815,7 @@ _ctl_mode_colors = {
     'halted': mabk,
     'reset*': yebk,
     '<step>': cybk,
+    'sample': grbk,
     '<*   >': grbk,
     '< *  >': grbk,
     '<  * >': grbk,
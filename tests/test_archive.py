@@ -0,0 +1,56 @@
+import pytest
+
+from archive import Archive, ArchiveError, pack, unpack
+from data import Db, Instr, Page, Sym
+
+
+def _pages(n):
+    return [
+        Page(i, f'{i * 4:08x}', ','.join(f'{i ^ r:08x}' for r in range(32)))
+        for i in range(1, n + 1)
+    ]
+
+
+@pytest.fixture
+def src(tmp_path):
+    path = str(tmp_path / 'a.db')
+    db = Db.to_file(path)
+    db.save_many(_pages(2500))
+    db.save_many([Instr('00000000', '00000013', 'nop')])
+    db.save_many([Sym('00000000', '_start')])
+    db.close()
+    return path
+
+
+@pytest.mark.parametrize('codec', ['zlib', 'lzma'])
+def test_pack_unpack_round_trip(tmp_path, src, codec):
+    rvz = str(tmp_path / 'a.rvz')
+    pack(src, rvz, codec)
+    unpack(rvz, str(tmp_path / 'b.db'))
+
+    a, b = Db.stored(src), Db.stored(str(tmp_path / 'b.db'))
+    for ent_type in (Page, Instr, Sym):
+        assert b.find_all(ent_type) == a.find_all(ent_type)
+    a.close()
+    b.close()
+
+
+def test_random_access(tmp_path, src):
+    rvz = str(tmp_path / 'a.rvz')
+    pack(src, rvz)
+    pages = _pages(2500)
+    archive = Archive.open(rvz, cached=2)
+    assert archive.count(Page) == len(pages)
+    for ndx in (2500, 1, 1024, 1025, 2049):
+        assert archive.find_by_ndx(Page, ndx) == pages[ndx - 1]
+    # ranges cross block boundaries
+    assert list(archive.iter_range(Page, 1000, 2100)) == pages[999:2099]
+    assert archive.find_by_ndx(Page, 2501) is None
+    assert archive.next_at(8, after=2) is None
+    assert archive.next_at(2500 * 4) == 2500
+    archive.close()
+
+
+def test_open_rejects_other_files(tmp_path, src):
+    with pytest.raises(ArchiveError):
+        Archive.open(src)
@@ -0,0 +1,70 @@
+import hashlib
+
+from archive import open_stored
+from chain import chain_pages, first_divergence
+from data import Chain, Db, Page
+from tracefile import convert
+
+
+_regs = ','.join(['00000000'] * 32)
+
+
+def _pages(n, changed=()):
+    return [
+        Page(i, f'{0 if i in changed else i * 4:08x}', _regs)
+        for i in range(1, n + 1)
+    ]
+
+
+def _db(pages, hashed=0):
+    db = Db.in_memory()
+    db.save_many(pages)
+    db.save_many(chain_pages(b'', pages[:hashed]))
+    return db
+
+
+def test_equal_traces():
+    assert first_divergence(_db(_pages(100)), _db(_pages(100), 100)) is None
+    assert first_divergence(_db([]), _db([])) is None
+
+
+def test_first_changed_page():
+    for ndx in (1, 2, 37, 99, 100):
+        a = _db(_pages(100), 100)
+        b = _db(_pages(100, {ndx, 60}), 50)
+        assert first_divergence(a, b) == min(ndx, 60)
+        assert first_divergence(b, a) == min(ndx, 60)
+
+
+def test_prefix_diverges_after_end():
+    assert first_divergence(_db(_pages(40)), _db(_pages(100))) == 41
+    assert first_divergence(_db(_pages(100), 100), _db(_pages(40))) == 41
+
+
+def test_case_of_hex_digits_is_ignored():
+    a = _db(_pages(10))
+    b = _db([page._replace(pc=page.pc.upper()) for page in _pages(10)])
+    b.save_many([Page(11, '0000abcd', _regs)])
+    a.save_many([Page(11, '0000ABCD', _regs)])
+    assert first_divergence(a, b) is None
+
+
+def test_inputs_are_not_written(tmp_path):
+    paths = [str(tmp_path / 'a.db'), str(tmp_path / 'b.db')]
+    for path, changed in zip(paths, ((), {77})):
+        db = Db.to_file(path)
+        db.save_many(_pages(100, changed))
+        db.close()
+    convert(paths[1], str(tmp_path / 'b.rvt'))
+    before = [hashlib.md5(open(path, 'rb').read()).digest() for path in paths]
+
+    a = Db.stored(paths[0])
+    for other in (paths[1], str(tmp_path / 'b.rvt')):
+        b = open_stored(other)
+        assert first_divergence(a, b) == 77
+        b.close()
+    assert a.count(Chain) == 0
+    a.close()
+
+    after = [hashlib.md5(open(path, 'rb').read()).digest() for path in paths]
+    assert after == before
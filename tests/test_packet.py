@@ -0,0 +1,45 @@
+from packet import Parser
+
+
+def _packet(pc=0x100, fields=31):
+    words = [pc] + list(range(1, fields + 1))
+    return b'P' + b','.join(b'%08x' % word for word in words) + b'\n'
+
+
+def test_parse_fixed_width():
+    parser = Parser()
+    packet = parser.parse(_packet())
+    assert packet.pc == 0x100
+    assert list(packet.regs) == list(range(1, 32))
+    assert packet.text.split(',')[0] == '00000100'
+    assert (parser.packets, parser.errors) == (1, 0)
+
+
+def test_parse_pads_short_fields():
+    parser = Parser()
+    data = b'P' + b','.join(b'%x' % word for word in range(32)) + b'\r\n'
+    packet = parser.parse(data)
+    assert packet.pc == 0
+    assert list(packet.regs) == list(range(1, 32))
+    assert packet.text == ','.join(f'{word:08x}' for word in range(32))
+
+
+def test_parse_more_fields_than_required():
+    packet = Parser().parse(_packet(fields=40))
+    assert len(packet.regs) == 40
+
+
+def test_parse_rejects_malformed():
+    bad = [
+        b'X' + _packet()[1:],
+        _packet(fields=30),
+        _packet().replace(b'00000001', b'0000000g'),
+        _packet().replace(b'00000001', b'000 0001'),
+        _packet().replace(b'00000001', b'123456789'),
+        _packet().replace(b',00000001,', b',,'),
+        b'P\xff' + _packet()[2:],
+    ]
+    parser = Parser()
+    for data in bad:
+        assert parser.parse(data) is None, data
+    assert (parser.packets, parser.errors) == (0, len(bad))
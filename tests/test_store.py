@@ -0,0 +1,70 @@
+import pytest
+
+from data import Db, DbError, Page, Session, Stamp
+from store import LiveStore
+
+
+def _pages(lo, hi):
+    return [
+        Page(i, f'{i * 4:08x}', ','.join(f'{i + r:08x}' for r in range(32)))
+        for i in range(lo, hi)
+    ]
+
+
+@pytest.fixture
+def store():
+    store = LiveStore(ring=16)
+    yield store
+    store.close()
+
+
+def test_pages_wrap_the_ring(store):
+    pages = _pages(1, 101)
+    for lo in range(0, 100, 7):
+        store.save_many(pages[lo:lo + 7])
+    assert store.count(Page) == 100
+    # newest pages come from the ring, older ones from disk
+    assert store.find_by_ndx(Page, 100) == pages[99]
+    assert store.find_by_ndx(Page, 85) == pages[84]
+    assert store.find_by_ndx(Page, 3) == pages[2]
+    assert list(store.iter_range(Page, 1, 101, batch=5)) == pages
+    assert store.find_all(Page) == pages
+
+
+def test_batch_larger_than_ring(store):
+    pages = _pages(1, 60)
+    store.save_batch(pages, [Stamp(page.ndx, page.ndx) for page in pages])
+    assert store.find_all(Page) == pages
+    assert store.count(Stamp) == len(pages)
+
+
+def test_everything_is_spilled(store, tmp_path):
+    store.save_one(Session(1, 0))
+    store.save_many(_pages(1, 41))
+    store.flush()
+    assert store._disk.find_all(Page) == _pages(1, 41)
+
+    path = str(tmp_path / 'a.db')
+    store.save_db(path)
+    saved = Db.stored(path)
+    assert saved.find_all(Page) == _pages(1, 41)
+    saved.close()
+    snap = store.snapshot()
+    assert snap.count(Page) == 40
+    assert snap.count(Session) == 1
+    snap.close()
+
+
+def test_spill_error_is_raised(store):
+    def fail(*ent_lists):
+        raise DbError('disk full')
+
+    store._disk.save_batch = fail
+    store.save_many(_pages(1, 9))
+    with pytest.raises(DbError):
+        store.flush()
+    # ring is not reused for pages that never reached disk
+    with pytest.raises(DbError):
+        store.save_many(_pages(9, 30))
+    with pytest.raises(DbError):
+        store.save_one(Session(1, 0))
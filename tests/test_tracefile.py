@@ -0,0 +1,61 @@
+import pytest
+
+from data import Db, Page
+from tracefile import TraceFile, TraceFileError, convert
+
+
+def _pages(n):
+    return [
+        Page(i, f'{i * 4:08x}', ','.join(f'{i + r:08x}' for r in range(32)))
+        for i in range(1, n + 1)
+    ]
+
+
+def _db(path, pages):
+    db = Db.to_file(str(path))
+    db.save_many(pages)
+    db.close()
+
+
+def test_convert_round_trip(tmp_path):
+    pages = _pages(5000)
+    _db(tmp_path / 'a.db', pages)
+
+    convert(str(tmp_path / 'a.db'), str(tmp_path / 'a.rvt'))
+    trace = TraceFile.open(str(tmp_path / 'a.rvt'))
+    assert trace.count(Page) == len(pages)
+    assert trace.find_by_ndx(Page, 4097) == pages[4096]
+    assert list(trace.iter_range(Page, 1, len(pages) + 1)) == pages
+    trace.close()
+
+    convert(str(tmp_path / 'a.rvt'), str(tmp_path / 'b.db'))
+    db = Db.stored(str(tmp_path / 'b.db'))
+    assert db.find_all(Page) == pages
+    db.close()
+
+
+def test_append_and_reopen(tmp_path):
+    path = str(tmp_path / 't.rvt')
+    pages = _pages(10)
+    trace = TraceFile.create(path)
+    trace.save_many(pages[:4])
+    # pages appended after the first read are mapped again
+    assert trace.find_by_ndx(Page, 4) == pages[3]
+    trace.save_many(pages[4:])
+    assert trace.find_by_ndx(Page, 10) == pages[9]
+    trace.close()
+
+    trace = TraceFile.open(path)
+    assert trace.find_all(Page) == pages
+    assert trace.find_by_ndx(Page, 11) is None
+    trace.close()
+
+
+def test_open_rejects_other_files(tmp_path):
+    path = tmp_path / 'x.rvt'
+    path.write_bytes(b'RVT')
+    with pytest.raises(TraceFileError):
+        TraceFile.open(str(path))
+    path.write_bytes(b'SQLite format 3\0' * 4)
+    with pytest.raises(TraceFileError):
+        TraceFile.open(str(path))
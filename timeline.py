@@ -0,0 +1,129 @@
+from array import array
+
+from data import Page
+
+
+class _Level:
+    def __init__(self, size):
+        # pages per bucket
+        self.size = size
+        self.mins = array('q')
+        self.maxs = array('q')
+        self.lasts = array('q')
+
+    def __len__(self):
+        return len(self.mins)
+
+    def put(self, b, mn, mx, last):
+        if b < len(self.mins):
+            self.mins[b] = mn
+            self.maxs[b] = mx
+            self.lasts[b] = last
+        else:
+            self.mins.append(mn)
+            self.maxs.append(mx)
+            self.lasts.append(last)
+
+
+class Timeline:
+    def __init__(self, reg, base=32, fanout=8):
+        # reg 0..31 selects a register, None selects pc
+        self.reg = reg
+        self.fanout = fanout
+        self.count = 0
+        self._levels = [_Level(base)]
+
+    def value_of(self, page):
+        if self.reg is None:
+            return int(page.pc, 16)
+        return int(page.regs.split(',')[self.reg], 16)
+
+    def extend(self, values):
+        if not values:
+            return
+        start = self.count
+        self.count += len(values)
+
+        # finest level is merged with the new values directly
+        level = self._levels[0]
+        for b in range(start // level.size, (self.count - 1) // level.size + 1):
+            lo = max(b * level.size, start) - start
+            hi = min((b + 1) * level.size, self.count) - start
+            chunk = values[lo:hi]
+            mn, mx = min(chunk), max(chunk)
+            if b < len(level):
+                mn = min(mn, level.mins[b])
+                mx = max(mx, level.maxs[b])
+            level.put(b, mn, mx, chunk[-1])
+
+        # coarser levels are refolded only where they were touched
+        i = 0
+        while len(self._levels[i]) > 1:
+            below = self._levels[i]
+            if i + 1 == len(self._levels):
+                self._levels.append(_Level(below.size * self.fanout))
+                lo = 0
+            else:
+                lo = start // below.size // self.fanout
+            level = self._levels[i + 1]
+            for b in range(lo, (len(below) - 1) // self.fanout + 1):
+                a, z = b * self.fanout, (b + 1) * self.fanout
+                level.put(
+                    b,
+                    min(below.mins[a:z]),
+                    max(below.maxs[a:z]),
+                    below.lasts[min(z, len(below)) - 1]
+                )
+            i += 1
+
+    def extend_pages(self, pages):
+        self.extend([self.value_of(page) for page in pages])
+
+    def catch_up(self, db, top, limit=20000):
+        hi = min(top + 1, self.count + 1 + limit)
+        if hi > self.count + 1:
+            self.extend_pages(list(db.iter_range(Page, self.count + 1, hi)))
+
+    def columns(self, lo, hi, n, db=None):
+        # aggregates of n columns over pages [lo, hi), from the coarsest
+        # level that still gives every column its own bucket
+        hi = min(hi, self.count + 1)
+        n = min(n, hi - lo)
+        if n <= 0:
+            return []
+        step = (hi - lo) / n
+        level = self._levels[0]
+        if db and step < level.size:
+            # zoomed past the finest level, few enough pages to read
+            return self._exact(db, lo, hi, n, step)
+        for coarser in self._levels[1:]:
+            if coarser.size * 2 > step:
+                break
+            level = coarser
+
+        cols = []
+        for c in range(n):
+            first = lo + int(c * step)
+            end = max(lo + int((c + 1) * step), first + 1)
+            a = (first - 1) // level.size
+            z = min((end - 2) // level.size + 1, len(level))
+            if a >= z:
+                break
+            cols.append((
+                first,
+                min(level.mins[a:z]),
+                max(level.maxs[a:z]),
+                level.lasts[z - 1]
+            ))
+        return cols
+
+    def _exact(self, db, lo, hi, n, step):
+        values = [self.value_of(page) for page in db.iter_range(Page, lo, hi)]
+        cols = []
+        for c in range(n):
+            a = int(c * step)
+            chunk = values[a:max(int((c + 1) * step), a + 1)]
+            if not chunk:
+                break
+            cols.append((lo + a, min(chunk), max(chunk), chunk[-1]))
+        return cols
@@ -0,0 +1,263 @@
+import mmap
+import os
+import struct
+import sys
+import time
+
+from array import array
+
+from data import Db, Gaps, Page
+
+
+_magic = b'RVT1'
+_version = 1
+# magic, version, record size, session start (unix ns)
+_header = struct.Struct('<4sHHQ')
+# pc followed by all 32 registers
+_record = struct.Struct('<33I')
+record_size = _record.size
+
+
+class TraceFileError(Exception):
+    pass
+
+
+def page_to_record(page):
+    regs = [int(reg, 16) for reg in page.regs.split(',')[:32]]
+    regs += [0] * (32 - len(regs))
+    return (int(page.pc, 16), *regs)
+
+
+def pack_pages(pages):
+    # hex text of a page is the big-endian image of its record
+    hexes = []
+    for page in pages:
+        text = page.pc.zfill(8) + page.regs.replace(',', '')
+        if len(text) != _record.size * 2:
+            text = ''.join(f'{word:08x}' for word in page_to_record(page))
+        hexes.append(text)
+    words = array('I', bytes.fromhex(''.join(hexes)))
+    if sys.byteorder == 'little':
+        words.byteswap()
+    return words.tobytes()
+
+
+def unpack_pages(ndx, data):
+    words = array('I', data)
+    if sys.byteorder == 'little':
+        words.byteswap()
+    data = words.tobytes()
+    for off in range(0, len(data), _record.size):
+        # pc and registers come out as one comma separated string
+        text = data[off:off + _record.size].hex(',', 4)
+        yield Page(ndx, text[:8], text[9:])
+        ndx += 1
+
+
+def record_to_page(ndx, record):
+    page, = unpack_pages(ndx, _record.pack(*record))
+    return page
+
+
+class TraceFile:
+    def __init__(self, fp, started):
+        self._fp = fp
+        self.started = started
+        self._mm = None
+        self._top = (os.fstat(fp.fileno()).st_size - _header.size) // _record.size
+
+    @classmethod
+    def create(cls, filename):
+        fp = open(filename, 'w+b')
+        started = time.time_ns()
+        fp.write(_header.pack(_magic, _version, _record.size, started))
+        fp.flush()
+        return cls(fp, started)
+
+    @classmethod
+    def open(cls, filename, writable=False):
+        # viewers only read, the file may be on read-only media
+        fp = open(filename, 'r+b' if writable else 'rb')
+        head = fp.read(_header.size)
+        if len(head) < _header.size:
+            raise TraceFileError('truncated trace file header')
+        magic, version, rec_size, started = _header.unpack(head)
+        if magic != _magic or version != _version or rec_size != _record.size:
+            raise TraceFileError('not a rivctl trace file')
+        return cls(fp, started)
+
+    def _view(self, upto):
+        # file only grows, remap when reading past the mapped part
+        end = _header.size + upto * _record.size
+        if self._mm is None or len(self._mm) < end:
+            self._fp.flush()
+            # old map stays alive as long as views exported from it
+            self._mm = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mm
+
+    def __len__(self):
+        return self._top
+
+    def append(self, record):
+        self._fp.seek(0, os.SEEK_END)
+        self._fp.write(_record.pack(*record))
+        self._top += 1
+
+    def flush(self):
+        self._fp.flush()
+
+    def append_many(self, records):
+        self._fp.seek(0, os.SEEK_END)
+        buf = bytearray()
+        n = 0
+        for record in records:
+            buf += _record.pack(*record)
+            n += 1
+        self._fp.write(buf)
+        self._top += n
+
+    def record(self, ndx):
+        if ndx < 1 or ndx > self._top:
+            return None
+        mm = self._view(ndx)
+        return _record.unpack_from(mm, _header.size + (ndx - 1) * _record.size)
+
+    def records(self, lo, hi):
+        lo = max(lo, 1)
+        hi = min(hi, self._top + 1)
+        if lo >= hi:
+            return
+        mm = self._view(hi - 1)
+        off = _header.size + (lo - 1) * _record.size
+        end = off + (hi - lo) * _record.size
+        yield from _record.iter_unpack(memoryview(mm)[off:end])
+
+    def words(self):
+        # flat u32 view over all records, layout matches little-endian host
+        mm = self._view(self._top)
+        end = _header.size + self._top * _record.size
+        return memoryview(mm)[_header.size:end].cast('I')
+
+    def column(self, reg):
+        # reg 0..31 selects a register, None selects pc
+        field = 0 if reg is None else reg + 1
+        return self.words()[field::33]
+
+    def array(self):
+        import numpy
+
+        mm = self._view(self._top)
+        return numpy.frombuffer(
+            mm, dtype='<u4', count=self._top * 33, offset=_header.size
+        ).reshape(-1, 33)
+
+    # Db-like interface, a trace file stores pages only
+
+    def count(self, ent_type):
+        return self._top if ent_type is Page else 0
+
+    def find_by_ndx(self, ent_type, ndx):
+        if ent_type is not Page:
+            return None
+        record = self.record(ndx)
+        return record_to_page(ndx, record) if record else None
+
+    def find_all(self, ent_type):
+        return list(self.iter_range(ent_type, 1, self._top + 1))
+
+    def iter_range(self, ent_type, lo, hi, batch=4096):
+        if ent_type is not Page:
+            return
+        hi = min(hi, self._top + 1)
+        for ndx in range(max(lo, 1), hi, batch):
+            end = min(ndx + batch, hi)
+            mm = self._view(end - 1)
+            off = _header.size + (ndx - 1) * _record.size
+            yield from unpack_pages(ndx, mm[off:off + (end - ndx) * _record.size])
+
+    def save_one(self, ent):
+        if type(ent) is Page:
+            self.append(page_to_record(ent))
+            self.flush()
+
+    def append_pages(self, pages):
+        if not pages:
+            return
+        data = pack_pages(pages)
+        self._fp.seek(0, os.SEEK_END)
+        self._fp.write(data)
+        self._top += len(data) // _record.size
+
+    def save_many(self, ents):
+        self.append_pages([ent for ent in ents if type(ent) is Page])
+        self.flush()
+
+    def save_batch(self, *ent_lists):
+        self.save_many(ent for ents in ent_lists for ent in ents)
+
+    def drop_all(self, ent_type):
+        pass
+
+    def index_prog(self):
+        pass
+
+    def search_prog(self, text, limit=15):
+        return []
+
+    def next_at(self, pc, after=0):
+        pcs = self.column(None)
+        for i in range(max(after, 0), len(pcs)):
+            if pcs[i] == pc:
+                return i + 1
+        return None
+
+    def count_at(self, pc):
+        return self.column(None).tolist().count(pc)
+
+    # pages are stored without receive time
+
+    def time_of(self, ndx):
+        return None
+
+    def ndx_at_wall(self, wall):
+        return None
+
+    def gaps(self, lo=1, hi=None, stall=100000000):
+        return Gaps(0, 0, 0, 0, 0)
+
+    def stalls(self, stall=100000000, limit=15):
+        return []
+
+    def snapshot(self):
+        db = Db.in_memory()
+        to_db(self, db)
+        return db
+
+    def close(self):
+        self._mm = None
+        self._fp.close()
+
+
+def from_db(db, trace, batch=4096):
+    top = db.count(Page)
+    for lo in range(1, top + 1, batch):
+        trace.append_pages(list(db.iter_range(Page, lo, lo + batch)))
+    trace.flush()
+
+
+def to_db(trace, db, batch=4096):
+    for lo in range(1, len(trace) + 1, batch):
+        db.save_many(trace.iter_range(Page, lo, lo + batch))
+
+
+def convert(src, dst):
+    if src.endswith('.rvt'):
+        trace = TraceFile.open(src)
+        db = Db.to_file(dst)
+        to_db(trace, db)
+    else:
+        db = Db.stored(src)
+        trace = TraceFile.create(dst)
+        from_db(db, trace)
+    trace.close()
+    db.close()
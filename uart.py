@@ -1,7 +1,11 @@
 import re
 import io
+import threading
+import time
 import serial
 
+from collections import deque
+
 
 class UartPacketOut:
     def __init__(self, data, on_send=None):
@@ -37,8 +41,10 @@ class UartPacketOut:
 
 
 class UartPacketIn:
-    def __init__(self, data):
+    def __init__(self, data, at):
         self.data = data
+        # host receive time, monotonic ns
+        self.at = at
 
     @property
     def cmd(self):
@@ -46,17 +52,28 @@ class UartPacketIn:
 
 
 class Uart:
-    def __init__(self, fp):
+    def __init__(self, fp, max_line=4096):
         self._fp = fp
         self._rx_buffer = b''
-        self._tx_queue = []
+        self._rx_packets = deque()
+        self._tx_queue = deque()
+        self._tx_lock = threading.Lock()
+        # longer lines are treated as lost framing and dropped
+        self._max_line = max_line
+
+        self.rx_bytes = 0
+        self.rx_packets = 0
+        self.tx_bytes = 0
+        self.framing_errors = 0
+        # raw rx/tx streams are recorded when set
+        self.spool = None
 
         self._tx_long_chunks = []
         self._tx_long_packet = None
 
     @classmethod
     def null(cls):
-        return cls(io.StringIO())
+        return cls(io.BytesIO())
 
     @classmethod
     def open(cls, dev, baud=9600):
@@ -65,28 +82,64 @@ class Uart:
         
         return cls(serial.Serial(dev, baud, timeout=0))
 
+    def feed(self, data, at=None):
+        # splits received bytes into packets, also used by reingest
+        self.rx_bytes += len(data)
+        self._rx_buffer += data
+        if b'\n' not in data:
+            if len(self._rx_buffer) > self._max_line:
+                self.framing_errors += 1
+                self._rx_buffer = b''
+            return
+
+        # several packets may arrive at once, hand them out one by one
+        *lines, self._rx_buffer = self._rx_buffer.split(b'\n')
+        if at is None:
+            at = time.monotonic_ns()
+        for line in lines:
+            if len(line) > self._max_line:
+                self.framing_errors += 1
+            elif line:
+                self._rx_packets.append(UartPacketIn(line + b'\n', at))
+                self.rx_packets += 1
+        if len(self._rx_buffer) > self._max_line:
+            self.framing_errors += 1
+            self._rx_buffer = b''
+
+    @property
+    def pending(self):
+        return len(self._rx_packets)
+
     def receive(self):
+        if self._rx_packets:
+            return self._rx_packets.popleft()
+
         i = 0
         while True:
             data = self._fp.readline()
             if not data:
                 break
             i += 1
-            self._rx_buffer += data
+            if self.spool:
+                self.spool.rx(data)
+            self.feed(data)
 
         if i == 0:
             return 0
 
-        if not self._rx_buffer.endswith(b'\n'):
+        if not self._rx_packets:
             return i
 
-        packet = UartPacketIn(self._rx_buffer)
-        self._rx_buffer = b''
-
-        return packet
+        return self._rx_packets.popleft()
     
+    @property
+    def tx_depth(self):
+        with self._tx_lock:
+            return len(self._tx_queue) + len(self._tx_long_chunks)
+
     def _enqueue(self, packet):
-        self._tx_queue.append(packet)
+        with self._tx_lock:
+            self._tx_queue.append(packet)
 
     def send_halt(self):
         self._enqueue(UartPacketOut.cmd('H'))
@@ -112,7 +165,19 @@ class Uart:
         data = f'[{stream}]'
         self._enqueue(UartPacketOut.long(data, on_send))
 
-    def send(self, max_chunk_len=128):
+    def send_block(self, loc, dump, on_send=None):
+        # part of program written at given address
+        instrs = [instr.upper() for instr in dump]
+        stream = ','.join(instrs)
+        data = f'[@{loc:X}:{stream}]'
+        self._enqueue(UartPacketOut.long(data, on_send))
+
+    def send_verify(self, block, total):
+        # device replies with crc32 of every block of program memory
+        self._enqueue(UartPacketOut.cmd(f'C{block:X},{total:X}'))
+
+    def _next_chunk(self, max_chunk_len):
+        # called with tx lock held
         if len(self._tx_long_chunks) > 0:
             # only push out part of previous long packet
             offset, data = self._tx_long_chunks.pop(0)
@@ -120,11 +185,7 @@ class Uart:
             if packet:
                 total_sent = offset + len(data)
                 packet.notify(total_sent / len(packet))
-            
-            # send long packets
-            out_len = self._fp.write(data)
-            self._fp.flush()
-            return out_len
+            return data
 
         chunk = b''
 
@@ -132,11 +193,12 @@ class Uart:
         self._tx_long_packet = None
         while len(self._tx_queue) > 0:
             # try sending short or long packets
-            packet = self._tx_queue.pop(0)
+            packet = self._tx_queue.popleft()
             if len(chunk) + len(packet) > max_chunk_len:
                 if len(packet) <= max_chunk_len:
-                    # short packet, store for next send
-                    self._tx_queue.insert(0, packet)
+                    # short packet, goes first with next send
+                    self._tx_queue.appendleft(packet)
+                    break
                 packet.notify(0.0)
                 offset = len(chunk)
                 # store long packet
@@ -147,11 +209,22 @@ class Uart:
             else:
                 chunk += packet.data
                 packet.notify(1.0)
+        return chunk
 
-        # send short packets
-        out_len = self._fp.write(chunk)
+    def send(self, max_chunk_len=128):
+        # queue is filled by ui and scripts, drained by capture worker,
+        # the port is written without holding the lock
+        with self._tx_lock:
+            data = self._next_chunk(max_chunk_len)
+
+        if self.spool and data:
+            self.spool.tx(data)
+        out_len = self._fp.write(data)
         self._fp.flush()
+        self.tx_bytes += out_len or 0
         return out_len
 
     def close(self):
         self._fp.close()
+        if self.spool:
+            self.spool.close()
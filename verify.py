@@ -0,0 +1,76 @@
+import struct
+import zlib
+
+
+def block_crcs(codes, block=64):
+    # crc32 over little-endian words, the way they sit in device memory
+    words = [int(code, 16) for code in codes]
+    data = struct.pack(f'<{len(words)}I', *words)
+    size = block * 4
+    return [
+        zlib.crc32(data[off:off + size]) for off in range(0, len(data), size)
+    ]
+
+
+def parse_crcs(data):
+    # C<crc>,<crc>,...\n
+    try:
+        text = data.decode(encoding='ascii')
+        return [int(crc, 16) for crc in text[1:].rstrip('\r\n').split(',')]
+    except (UnicodeDecodeError, ValueError):
+        return None
+
+
+class Verifier:
+    def __init__(self, instrs, block=64, retries=2, timeout=5.0):
+        self.instrs = instrs
+        self.block = block
+        self.retries = retries
+        self.timeout = timeout
+        self.rounds = 0
+        self.local = block_crcs([instr.code for instr in instrs], block)
+        # indices of mismatching blocks, None until the device replies
+        self.bad = None
+        self.finished = False
+        self.lost = False
+        self._sent_at = None
+
+    def request(self, uart, now):
+        # goes out after anything queued before, eg. the program itself
+        uart.send_verify(self.block, len(self.instrs))
+        self._sent_at = now
+        self.rounds += 1
+
+    def check(self, uart, now):
+        if self.finished or self._sent_at is None:
+            return
+        if uart.tx_depth > 0:
+            # program may still be on its way, wait counts from the end
+            self._sent_at = now
+        elif now - self._sent_at > self.timeout:
+            self.lost = True
+            self._finish()
+
+    def reply(self, uart, data, now):
+        crcs = parse_crcs(data)
+        if crcs is None or self.finished:
+            return
+        crcs += [None] * (len(self.local) - len(crcs))
+        self.bad = [
+            i for i, (mine, theirs) in enumerate(zip(self.local, crcs))
+            if mine != theirs
+        ]
+        if not self.bad or self.rounds > self.retries:
+            self._finish()
+            return
+
+        # only blocks that differ are sent again, then checked again
+        for i in self.bad:
+            instrs = self.instrs[i * self.block:(i + 1) * self.block]
+            uart.send_block(
+                int(instrs[0].loc, 16), [instr.code for instr in instrs]
+            )
+        self.request(uart, now)
+
+    def _finish(self):
+        self.finished = True
@@ -93,6 +93,9 @@ class ModeModel(namedtuple('ModeModel', 'page ctl')):
     def to_reset(self):
         return self
 
+    def to_sample(self):
+        return ModeModel(self.page, 'sample')
+
     def to_upload(self):
         return ModeModel(self.page, 'upload')
 
@@ -118,6 +121,10 @@ class Overlays:
         if update(poll_result) == 'quit':
             close()
             self._stack.pop()
+            return True
+        return False
+
+    def stage(self):
         # in case update replaced overlay, won't redraw old window
         if self.has_any:
             redraw_overlay, _, _ = self._stack[-1]
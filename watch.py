@@ -0,0 +1,81 @@
+import ast
+
+from regs import reg_names
+
+
+_reg_ndx = {name: i for i, name in enumerate(reg_names)}
+_reg_ndx.update({f'x{i}': i for i in range(32)})
+_reg_ndx['fp'] = 8
+
+_allowed = (
+    ast.Expression, ast.BoolOp, ast.BinOp, ast.UnaryOp, ast.Compare,
+    ast.Name, ast.Load, ast.Constant,
+    ast.And, ast.Or, ast.Not, ast.Invert, ast.USub,
+    ast.BitAnd, ast.BitOr, ast.BitXor, ast.LShift, ast.RShift,
+    ast.Add, ast.Sub, ast.Mult, ast.FloorDiv, ast.Mod,
+    ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+)
+
+
+class WatchError(Exception):
+    pass
+
+
+class _Shift32(ast.NodeTransformer):
+    # shifts work as on the core, count is taken mod 32 and a left shift
+    # stays 32 bits wide, otherwise a0 << 0xffffffff eats all memory
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        if not isinstance(node.op, (ast.LShift, ast.RShift)):
+            return node
+        node.right = ast.BinOp(node.right, ast.BitAnd(), ast.Constant(31))
+        if isinstance(node.op, ast.RShift):
+            return node
+        return ast.BinOp(node, ast.BitAnd(), ast.Constant(0xffffffff))
+
+
+def _compile(text):
+    try:
+        tree = ast.parse(text, mode='eval')
+    except SyntaxError:
+        raise WatchError(f'bad expression \'{text}\'')
+
+    used = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, _allowed):
+            raise WatchError(f'\'{type(node).__name__}\' not allowed')
+        if isinstance(node, ast.Constant) and type(node.value) is not int:
+            raise WatchError(f'\'{node.value}\' is not an integer')
+        if isinstance(node, ast.Name):
+            if node.id != 'pc' and node.id not in _reg_ndx:
+                raise WatchError(f'unknown register \'{node.id}\'')
+            used.add(node.id)
+
+    # only registers used by the expression are decoded from a packet
+    lines = ['def _test(pc, regs):']
+    for name in sorted(used - {'pc'}):
+        lines.append(f'    {name} = int(regs[{_reg_ndx[name]}], 16)')
+    tree = _Shift32().visit(tree)
+    lines.append(f'    return bool({ast.unparse(tree.body)})')
+
+    scope = {}
+    exec(compile('\n'.join(lines), f'<watch {text}>', 'exec'), scope)
+    return scope['_test']
+
+
+class Watch:
+    def __init__(self, text):
+        self.text = text
+        self._test = _compile(text)
+        self._armed = True
+
+    def check(self, pc, regs):
+        # fires once when expression becomes true
+        try:
+            hit = self._test(pc, regs)
+        except ArithmeticError:
+            # eg. a0 % a1 while a1 is 0, counts as false
+            hit = False
+        fired = hit and self._armed
+        self._armed = not hit
+        return fired